@@ -1,3 +1,4 @@
+import os
 import streamlit as st
 import pandas as pd
 import pydeck as pdk
@@ -5,6 +6,9 @@ import matplotlib.pyplot as plt
 import numpy as np
 import itertools
 
+# La descarga de OpenFlights y el calculo de los trayectos estan en el motor, que no depende de Streamlit
+from flights_engine import airport_index, build_journeys, journeys_path, openflights_version, read_openflights
+
 
 @st.cache_data
 def load_data():
@@ -16,73 +20,37 @@ def load_data():
     - Tres objetos de tipo pandas.Dataframe:
         df_airports, df_airlines, df_routes
     """
-    # Leer los datos directamente desde GitHub
-    url_airports = "https://raw.githubusercontent.com/jpatokal/openflights/master/data/airports.dat"
-    url_airlines = "https://raw.githubusercontent.com/jpatokal/openflights/master/data/airlines.dat"
-    url_routes = "https://raw.githubusercontent.com/jpatokal/openflights/master/data/routes.dat"
-
-    # Columnas para cada archivo (documentadas en OpenFlights)
-    columns_airports = [
-        "Airport ID", "Name", "City", "Country", "IATA", "ICAO",
-        "Latitude", "Longitude", "Altitude", "Timezone", "DST",
-        "Tz database time zone", "Type", "Source"
-    ]
-
-    columns_airlines = [
-        "Airline ID", "Name", "Alias", "IATA", "ICAO", "Callsign",
-        "Country", "Active"
-    ]
-
-    columns_routes = [
-        "Airline", "Airline ID", "Source airport", "Source airport ID",
-        "Destination airport", "Destination airport ID",
-        "Codeshare", "Stops", "Equipment"
-    ]
-
-    # Cargar los DataFrames
-    df_airports = pd.read_csv(url_airports, header=None, names=columns_airports)
-    df_airlines = pd.read_csv(url_airlines, header=None, names=columns_airlines)
-    df_routes = pd.read_csv(url_routes, header=None, names=columns_routes)
-
-    return df_airports, df_airlines, df_routes
-
-
-def unir_pos_geografica(df, columns=["Source airport", "Destination airport"]):
-    combinaciones = list(itertools.product(["Latitude", "Longitude"], columns))
-    for eje, posicion in combinaciones:
-        df = df.merge(
-            df_airports[["IATA", eje]],
-            left_on=posicion,
-            right_on="IATA",
-            how="left"
-        )
-
-        df.rename(columns={eje: f"{posicion.split()[0]} {eje}"}, inplace=True)
-        df.drop(columns=["IATA"], inplace=True)
-    return df 
+    return read_openflights()
 
 
-def num_vuelos_ida_vuelta(df):
-    contador_viajes = dict()
-
-    for elem in df["Journeys"]:
-        if elem in contador_viajes:
-            contador_viajes[elem]+=1
-
-        else:
-            elem_split = elem.split("-")
-            elem_reverse = elem_split[1]+"-"+elem_split[0]
+@st.cache_data
+def load_airport_index(df_airports):
+    """
+    Construye una vez con los datos el indice de los aeropuertos (codigo IATA -> fila de df_airports),
+    para sacar columnas de los aeropuertos sin merges, ver `airport_index`.
 
-            if elem_reverse in contador_viajes:
-                contador_viajes[elem_reverse]+=1
+    Returns:
+    -------
+    - Series con la fila de cada codigo IATA
+    """
+    return airport_index(df_airports)
 
-            else:
-                contador_viajes[elem]=1
 
-    df_result = pd.DataFrame([{"Journeys": k, "Num vuelos": v} for k, v in contador_viajes.items()])
-    df_result = pd.merge(df_result, df[["Journeys", "Source airport", "Destination airport"]], on="Journeys", how="left")
-    return df_result
+@st.cache_data
+def load_journeys(df_airports, df_routes, _index=None):
+    """
+    Devuelve los trayectos de ida y vuelta con su posición. Si el CLI del motor ya los ha precalculado
+    (con --routes) con los mismos datos de OpenFlights que se acaban de descargar se leen de disco, y si no
+    se calculan aqui con el indice de los aeropuertos.
 
+    Returns:
+    -------
+    - DataFrame con los trayectos, ver `build_journeys`
+    """
+    path = journeys_path(openflights_version(df_airports, df_routes))
+    if os.path.exists(path):
+        return pd.read_parquet(path)
+    return build_journeys(df_airports, df_routes, _index)
 
 
 def get_color_function(v_max, cmap_type, v_min=1):
@@ -164,112 +132,110 @@ def n_columns_sidebar(n_elems, list_elems):
 
 #---------------------------------------------------------------------------------------
 # Realización de calculos iniciales:
-# Cargamos los df originales
-df_airports, df_airlines, df_routes = load_data()
-
-combinaciones = list(itertools.product(["Latitude", "Longitude"], ["Source", "Destination"]))
+# Solo cuando Streamlit ejecuta el script, asi las funciones se pueden importar (por ejemplo desde las
+# pruebas de rendimiento) sin descargar los datos
+if __name__ == "__main__":
+    # Cargamos los df originales
+    df_airports, df_airlines, df_routes = load_data()
 
-df_trips = df_routes.groupby(["Source airport", "Destination airport"]).size().reset_index(name="vuelos")
-df_trips["Journeys"] = df_trips["Source airport"] + "-" + df_trips["Destination airport"]
+    combinaciones = list(itertools.product(["Latitude", "Longitude"], ["Source", "Destination"]))
 
+    df_ida_vuelta = load_journeys(df_airports, df_routes, load_airport_index(df_airports))
 
-df_ida_vuelta = num_vuelos_ida_vuelta(df_trips)
-df_ida_vuelta = unir_pos_geografica(df_ida_vuelta)
 
+    # Establecemos los colores que usaremos para los arcos y dibujamos la colorbar
+    v_max=df_ida_vuelta["Num vuelos"].max()
+    cmap_type ="hot"
+    color_func = get_color_function(v_max=v_max, cmap_type=cmap_type)
 
-# Establecemos los colores que usaremos para los arcos y dibujamos la colorbar
-v_max=df_ida_vuelta["Num vuelos"].max()
-cmap_type ="hot"
-color_func = get_color_function(v_max=v_max, cmap_type=cmap_type)
 
+    df_ida_vuelta["color"] = df_ida_vuelta["Num vuelos"].apply(color_func)
 
-df_ida_vuelta["color"] = df_ida_vuelta["Num vuelos"].apply(color_func)
 
-
-# Capa de arcos
-arc_layer = pdk.Layer(
-    "ArcLayer",
-    data=df_ida_vuelta,
-    get_source_position=["Source Longitude", "Source Latitude"],
-    get_target_position=["Destination Longitude", "Destination Latitude"],
-    get_source_color="color",
-    get_target_color="color",
-    pickable=True
-)
+    # Capa de arcos
+    arc_layer = pdk.Layer(
+        "ArcLayer",
+        data=df_ida_vuelta,
+        get_source_position=["Source Longitude", "Source Latitude"],
+        get_target_position=["Destination Longitude", "Destination Latitude"],
+        get_source_color="color",
+        get_target_color="color",
+        pickable=True
+    )
 
 
 
-# ---------------------------------------------------------------------------
-# Sidebar
-st.sidebar.title("Dataframes a mostrar en la pantalla")
+    # ---------------------------------------------------------------------------
+    # Sidebar
+    st.sidebar.title("Dataframes a mostrar en la pantalla")
 
-# Checkboxes para saber que dataframes mostrar abajo
-list_df = [(df_airports, "df_airports"), (df_airlines, "df_airlines"), (df_routes, "df_routes"), (df_ida_vuelta, "df_ida_vuelta")]
-checkbox = dict()
-for df in list_df:
-    checkbox[df[1]] = st.sidebar.checkbox(df[1])
+    # Checkboxes para saber que dataframes mostrar abajo
+    list_df = [(df_airports, "df_airports"), (df_airlines, "df_airlines"), (df_routes, "df_routes"), (df_ida_vuelta, "df_ida_vuelta")]
+    checkbox = dict()
+    for df in list_df:
+        checkbox[df[1]] = st.sidebar.checkbox(df[1])
 
     
-st.sidebar.title("Filtrado")
+    st.sidebar.title("Filtrado")
 
-# Inicializamos lista de filtros si no existe
-if "filtros" not in st.session_state:
-    st.session_state.filtros = []
+    # Inicializamos lista de filtros si no existe
+    if "filtros" not in st.session_state:
+        st.session_state.filtros = []
 
 
 
-button_add_filter, button_filter = n_columns_sidebar(n_elems=2, 
-    list_elems=[lambda: st.button("Añadir filtro"),
-                lambda: st.button("Realizar filtro")]
-)
+    button_add_filter, button_filter = n_columns_sidebar(n_elems=2, 
+        list_elems=[lambda: st.button("Añadir filtro"),
+                    lambda: st.button("Realizar filtro")]
+    )
 
-# Si el botón "Añadir filtro" fue presionado, activa el filtro
-if button_add_filter:
-    # Añadir un filtro vacío (puedes personalizar valores por defecto)
-    st.session_state.filtros.append({"columna": None, "elemento": None})
+    # Si el botón "Añadir filtro" fue presionado, activa el filtro
+    if button_add_filter:
+        # Añadir un filtro vacío (puedes personalizar valores por defecto)
+        st.session_state.filtros.append({"columna": None, "elemento": None})
 
 
 
-for i, filtro in enumerate(st.session_state.filtros):
-    col1, col2 = two_columns_sidebar(
-        elem1=lambda key=f"columna_{i}": st.selectbox(
-            "Elige una columna", ["1", "2", "3"], key=key
-        ),
-        elem2=lambda key=f"elemento_{i}": st.selectbox(
-            "Elige un elemento", ["A", "B", "C"], key=key
+    for i, filtro in enumerate(st.session_state.filtros):
+        col1, col2 = two_columns_sidebar(
+            elem1=lambda key=f"columna_{i}": st.selectbox(
+                "Elige una columna", ["1", "2", "3"], key=key
+            ),
+            elem2=lambda key=f"elemento_{i}": st.selectbox(
+                "Elige un elemento", ["A", "B", "C"], key=key
+            )
         )
-    )
 
 
 
 
-#-----------------------------------------------------------------------------------------
-# Pagina principal
+    #-----------------------------------------------------------------------------------------
+    # Pagina principal
 
-# Dividimos la página principal en 3 columnas
-col1, col2, col3= st.columns([15, 60, 10])
+    # Dividimos la página principal en 3 columnas
+    col1, col2, col3= st.columns([15, 60, 10])
 
-mostrar_colorbar(v_max, cmap_type)
+    mostrar_colorbar(v_max, cmap_type)
 
-# Mostrar en Streamlit
-initial_view_state = pdk.ViewState(
-    latitude=df_ida_vuelta["Source Latitude"].mean(),
-    longitude=df_ida_vuelta["Source Longitude"].mean(),
-    zoom=2
-)
+    # Mostrar en Streamlit
+    initial_view_state = pdk.ViewState(
+        latitude=df_ida_vuelta["Source Latitude"].mean(),
+        longitude=df_ida_vuelta["Source Longitude"].mean(),
+        zoom=2
+    )
 
-with col2:
-    st.pydeck_chart(pdk.Deck(
-        layers=[arc_layer],
-        tooltip={"text": "Journeys"},
-        initial_view_state=initial_view_state,
-        height=400
-    ))
+    with col2:
+        st.pydeck_chart(pdk.Deck(
+            layers=[arc_layer],
+            tooltip={"text": "Journeys"},
+            initial_view_state=initial_view_state,
+            height=400
+        ))
 
 
 
-for df in list_df:
-    if checkbox[df[1]]:
-        st.dataframe(df[0].head(20))
+    for df in list_df:
+        if checkbox[df[1]]:
+            st.dataframe(df[0].head(20))
 
-st.write(v_max)
\ No newline at end of file
+    st.write(v_max)
\ No newline at end of file
@@ -1,52 +1,112 @@
+import os
+import functools
+import sys
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
 import pandas as pd
-import pydeck as pdk
-import matplotlib.pyplot as plt
-import numpy as np
-import itertools
-import gzip
-import plotly.express as px
 import plotly.graph_objects as go
 
+# La carga, los filtros y las agregaciones estan en el motor, que no depende de Streamlit
+from flights_engine import (
+    atomic_write, compile_filters, count_flights_by_country, count_flights_per_period,
+    count_flights_per_period_by_continent, date_to_day, day_index, days_to_dates, decode_airports, decode_days,
+    filter_pieces, filters_key, finish_profiling, flight_table_rows, hourly_flights, hours_to_milliseconds,
+    incoming_dir, LiveFlights, load_aggregates, profile_log, profiling, read_data, sort_key, stage,
+    start_profiling, table_rows,
+)
+
+
+# Vuelos que se cuentan en cada país en el mapa, según la opción elegida
+map_modes = {"Origen": "origin", "Destino": "destination", "Origen + destino": "both"}
+
+# Resoluciones de la gráfica de líneas (ver `periods` en el motor)
+line_periods = {"Hora": "hour", "Día": "day", "Semana": "week"}
 
-st.set_page_config(layout="wide", initial_sidebar_state="expanded")
+# Fichero donde se escribe el progreso de la precarga, para que el health check pueda esperar a que termine,
+# y número de hilos que calculan las gráficas de la precarga. Streamlit no ejecuta el script hasta que se abre
+# la primera sesión, asi que el health check tiene que abrir una (cargar la página, no basta con
+# /_stcore/health) y después esperar con `warmup_finished` pasándole el pid del servidor: el fichero que
+# dejó un proceso anterior lleva otro pid y no cuenta como terminado
+warmup_file = os.environ.get("WARMUP_STATUS_FILE", "warmup_status.json")
+warmup_workers = int(os.environ.get("WARMUP_WORKERS", 4))
 
-st.markdown("""
-    <style>
-        html, body, [data-testid="stApp"] {
-            height: 100vh;
-        }
+# Instrumentación: con APP_PROFILE=1 se mide el tiempo y la memoria de cada etapa de cada ejecución, se muestran
+# en la barra lateral y se añaden a `profile_log` (una línea JSON por ejecución). Con ?profile=1 en la URL solo se
+# miden los tiempos de esa ejecución: medir la memoria activa tracemalloc en todo el proceso y lo hace más lento
+profile_enabled = os.environ.get("APP_PROFILE") == "1"
 
-        .block-container {
-            padding-top: 1rem;
-            padding-bottom: 1rem;
-            height: 100vh;
-        }
+# Memoria máxima (en MB) de la cache de resultados de las gráficas, se puede cambiar con una variable de entorno
+result_cache_mb = float(os.environ.get("RESULT_CACHE_MB", 256))
 
-        .main {
-            height: 100%;
-        }
 
-        /* Opcional: elimina el espacio de header/footer */
-        header, footer, #MainMenu {
-            visibility: hidden;
-        }
-    </style>
-""", unsafe_allow_html=True)
+def record_payload(name, fig):
+    """
+    Apunta, si la instrumentación está activa, cuántos bytes ocupa una figura al enviarla al navegador.
+
+    Parameters:
+    - name (str): Nombre de la figura.
+    - fig (Figure): La figura de Plotly.
+    """
+    stages = getattr(profiling, "stages", None)
+    if stages is not None:
+        stages.append({"stage": f"envío {name}", "depth": profiling.depth, "bytes": len(fig.to_json())})
+
+
+@st.cache_resource(show_spinner=False)
+def start_loading_data():
+    """
+    Empieza a cargar los datos en un hilo aparte, una sola vez por proceso. Asi la carga avanza
+    mientras se muestra la introducción.
+
+    Returns:
+    - Future: El resultado futuro de `read_data`.
+    """
+    return ThreadPoolExecutor(max_workers=1).submit(read_data)
 
 
-@st.cache_data
 def load_data():
     """
-    Carga los datos públicos
+    Espera a que termine la carga de `start_loading_data` (o la empieza si no se habia hecho).
+    Todas las sesiones reciben los mismos DataFrames.
 
     Returns:
     -------
-    - df con los datos
+    - df con los datos, df_continents con los aeropuertos, df_cube con los vuelos agregados y
+      la version de los datos
     """
-    df = pd.read_csv("df.csv")
-    df_continents = pd.read_csv("df_continents.csv")
-    return df, df_continents
+    future = start_loading_data()
+    if not future.done():
+        with st.spinner("Cargando datos..."):
+            future.exception()
+
+    if future.exception() is not None:
+        # Si la carga falla no se guarda el error, asi la siguiente ejecución lo vuelve a intentar
+        start_loading_data.clear()
+    return future.result()
+
+
+@st.cache_resource(show_spinner=False)
+def get_live_flights(version, _df, _df_continents, _df_cube):
+    """
+    Prepara una sola vez por proceso los vuelos a los que se van añadiendo los lotes nuevos: los indices
+    de fechas de los vuelos y de la tabla agregada (ordenados por fecha, para filtrar las fechas con una
+    busqueda binaria) y los agregados sin filtros, los precalculados por el CLI del motor si los hay.
+
+    Parameters:
+    - version (str): La version de los datos, es la clave de la cache.
+    - _df (DataFrame): Los vuelos.
+    - _df_continents (DataFrame): Los aeropuertos.
+    - _df_cube (DataFrame): Los vuelos agregados.
+
+    Returns:
+    - LiveFlights: Los vuelos vivos, compartidos por todas las sesiones.
+    """
+    return LiveFlights(_df, _df_cube, _df_continents, version, (day_index(_df), day_index(_df_cube)),
+                       load_aggregates(version))
 
 
 def two_columns_sidebar(elem1, elem2):
@@ -85,187 +145,198 @@ def n_columns_sidebar(n_elems, list_elems):
 
     return res
 
-def count_flights_per_day(df):
+def result_size(value):
     """
-    Cuenta el número de vuelos por día a partir de un DataFrame.
+    Estima la memoria que ocupa un resultado guardado en la cache.
 
     Parameters:
-    - df (DataFrame): Un DataFrame de pandas que debe contener una columna llamada "day" con los días de los vuelos.
+    - value: Una figura de Plotly, un DataFrame, una Series o cualquier otro objeto.
 
     Returns:
-    - DataFrame: Un nuevo DataFrame que contiene dos columnas: "num_flights" (número de vuelos) y "day" (días).
+    - int: El tamaño aproximado en bytes.
     """
-    df_count = pd.DataFrame()
-    df_count["num_flights"] = df["day"].value_counts().sort_index()
-    df_count["day"] = df_count.index
+    if isinstance(value, go.Figure):
+        return len(value.to_json())
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage(deep=True).sum())
+    return sys.getsizeof(value)
 
-    return df_count
 
-def count_flights_by_country_origin(df, df_continents):
+class ResultCache:
     """
-    Cuenta la cantidad total de vuelos por país de origen, 
-    asociando cada código ICAO con su país correspondiente.
-
-    Parameters
-    df : pandas.DataFrame
-        DataFrame que contiene datos de vuelos, con al menos una columna llamada 'origin' 
-        que representa el código ICAO del aeropuerto de origen de cada vuelo.
-    
-    df_continents : pandas.DataFrame
-        DataFrame con información sobre aeropuertos, que incluye al menos las columnas:
-        - 'icao_code': código ICAO del aeropuerto
-        - 'country_name': nombre del país correspondiente
-
-    Returns
-        Un DataFrame con dos columnas:
-        - 'country_name': nombre del país
-        - 'num_flights': número total de vuelos originados en aeropuertos de ese país
+    Cache LRU de resultados compartida por todas las sesiones, con un tamaño máximo en memoria.
+    Las claves las construye quien la usa (por ejemplo con los filtros normalizados y la version
+    de los datos), asi que no hace falta calcular el hash de los DataFrames.
     """
 
-    df_count = df["origin"].value_counts().reset_index()
-    df_count.columns = ["origin", "num_flights"]
-    df_merge = pd.merge(df_count, df_continents, left_on="origin", right_on="icao_code", how="left")
-    df_sum = df_merge.groupby("country_name")["num_flights"].sum().reset_index()
-
-    return df_sum
-
-
-
-def filter_df_continent(df_continents, col, elem):
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        """
+        Devuelve el resultado guardado para `key` o, si no está, lo calcula con `compute()` y lo guarda,
+        quitando los resultados usados hace más tiempo hasta que quepa.
+
+        Parameters:
+        - key (tuple): La clave del resultado.
+        - compute (function): Función sin argumentos que calcula el resultado.
+
+        Returns:
+        - El resultado.
+        """
+        with self.lock:
+            if key in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return self.entries[key][0]
+            self.misses += 1
+
+        value = compute()
+        size = result_size(value)
+
+        with self.lock:
+            # Un resultado más grande que toda la cache no se guarda
+            if size <= self.max_bytes and key not in self.entries:
+                self.entries[key] = (value, size)
+                self.size += size
+                while self.size > self.max_bytes:
+                    _, (_, old_size) = self.entries.popitem(last=False)
+                    self.size -= old_size
+
+        return value
+
+    def stats(self):
+        """
+        Returns:
+        - dict: Aciertos, fallos, número de resultados y memoria usada (en bytes).
+        """
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries), "bytes": self.size}
+
+
+@st.cache_resource
+def get_result_cache():
     """
-    Filtra un DataFrame de continentes basado en un valor específico de una columna.
-
-    Parameters:
-    - df_continents (DataFrame): Un DataFrame de pandas que contiene información sobre continentes.
-    - col (str): El nombre de la columna en la que se desea aplicar el filtro.
-    - elem (str): El valor que se utilizará para filtrar la columna especificada.
+    Crea la cache de resultados una sola vez por proceso.
 
     Returns:
-    - DataFrame: Un nuevo DataFrame que contiene solo las filas donde el valor de `col` es igual a `elem`.
+    - ResultCache: La cache compartida.
     """
-    df_continents_filt =  df_continents[df_continents[col]==elem]
-    return df_continents_filt
+    return ResultCache(int(result_cache_mb * 1024 * 1024))
+
 
-def filter_df(df, df_continents_filt):
+def cached_result(name, filtros, compute):
     """
-    Filtra un DataFrame basado en los códigos ICAO de un DataFrame de continentes filtrados.
+    Obtiene un resultado de la cache compartida usando como clave su nombre, la version de los datos
+    y los filtros aplicados.
 
     Parameters:
-    - df (DataFrame): Un DataFrame de pandas que contiene información sobre vuelos, incluyendo columnas "origin" y "destination".
-    - df_continents_filt (DataFrame): Un DataFrame de pandas que contiene una columna "icao_code" con los códigos ICAO de los continentes filtrados.
+    - name (str): Nombre del resultado (por ejemplo "graph_line").
+    - filtros (list): Los filtros aplicados.
+    - compute (function): Función sin argumentos que calcula el resultado.
 
     Returns:
-    - DataFrame: Un nuevo DataFrame que contiene solo las filas donde el "origin" o "destination" están en la lista de códigos ICAO del DataFrame de continentes filtrados.
-    """
-    df_filt = df[df["origin"].isin(df_continents_filt["icao_code"]) | df["destination"].isin(df_continents_filt["icao_code"])]
-    return df_filt
-
-def do_filter(col, elem, df_filtered, df_continents_filtered):
+    - El resultado.
     """
-    Aplica un filtro a un DataFrame de continentes y luego filtra otro DataFrame basado en el resultado.
+    return get_result_cache().get_or_compute(result_key(name, version, filtros), compute)
 
-    Paramters:
-    - col (str): El nombre de la columna en el DataFrame de continentes que se utilizará para aplicar el filtro.
-    - elem (str): El valor que se utilizará para filtrar la columna especificada en el DataFrame de continentes.
-    - df_filtered (DataFrame): Un DataFrame de pandas que contiene información que se filtrará en función de los continentes.
-    - df_continents_filtered (DataFrame): Un DataFrame de pandas que contiene información sobre continentes, que será filtrado.
 
-    Returns
-    - tuple: Una tupla que contiene dos elementos:
-        - DataFrame: El DataFrame filtrado basado en los continentes.
-        - DataFrame: El DataFrame de continentes filtrados después de aplicar el filtro.
-    """
-    df_continents_filtered = filter_df_continent(df_continents_filtered, col, elem)
-    df_filt = filter_df(df_filtered, df_continents_filtered)
-    return df_filt, df_continents_filtered
-   
-def filter_day(df, type_filter, day):
+def result_key(name, version, filtros):
     """
-    Filtra un DataFrame basado en el valor de la columna "day" según el tipo de filtro especificado.
+    Construye la clave de un resultado en la cache compartida.
 
-    Parameters
-    - df (DataFrame): Un DataFrame de pandas que contiene una columna llamada "day".
-    - type_filter (str): El tipo de filtro a aplicar. Puede ser "=", "<", o ">".
-    - day (str o int): El valor que se utilizará para filtrar la columna "day". El tipo debe coincidir con el tipo de datos en la columna.
+    Parameters:
+    - name (str): Nombre del resultado.
+    - version (str): La version de los datos.
+    - filtros (list): Los filtros aplicados.
 
-    Returns
-    - DataFrame: Un nuevo DataFrame que contiene solo las filas que cumplen con la condición del filtro.
+    Returns:
+    - tuple: La clave.
     """
-    if type_filter == "=":
-        df = df[df["day"]==day]
+    return (name, version, filters_key(filtros))
 
-    elif type_filter == "<":
-        df = df[df["day"]<day]
 
-    elif type_filter == ">":
-        df = df[df["day"]>day]
-
-    return df
-
-
-def graph_df_total_line(df):
+def graph_df_total_line(df_total_count, x, title="Vuelos por día"):
     """
-    Genera un gráfico de líneas que muestra el total de vuelos por día a partir de un DataFrame.
+    Genera un gráfico de líneas que muestra el total de vuelos por intervalo de tiempo.
 
     Parameters:
-    - df (DataFrame): Un DataFrame de pandas que contiene información sobre vuelos, incluyendo una columna "day".
+    - df_total_count (DataFrame): El número de vuelos de cada intervalo, de `count_flights_per_period`.
+    - x (ndarray): El inicio de cada intervalo en milisegundos desde el 1970-01-01 (de `hours_to_milliseconds`).
+    - title (str): El título de la gráfica.
 
     Returns:
-    - Figure: Un objeto de figura de Plotly que representa el gráfico de total de vuelos por día.
+    - Figure: Un objeto de figura de Plotly que representa el gráfico de total de vuelos por intervalo.
     """
-    df_total_count = count_flights_per_day(df)
     fig = go.Figure()
 
     fig.add_trace(
-    go.Scatter(
-        x=df_total_count["day"],
-        y=df_total_count["num_flights"],
+    go.Scattergl(
+        x=x,
+        y=df_total_count["num_flights"].to_numpy(),
         mode="lines+markers",
         hovertemplate=("day: %{x}<br> num_flights: %{y}<br>"),
         name="Total"
         )
     )
 
+    # Con uirevision fijo el navegador actualiza los datos de la misma gráfica al cambiar los filtros,
+    # sin volver a dibujarla desde cero ni perder el zoom o las lineas ocultas en la leyenda.
+    # Las x son números, el tipo "date" hace que el eje las muestre como fechas
     fig.update_layout(
-        xaxis_title="Día",
+        xaxis_title="Fecha",
+        xaxis_type="date",
         yaxis_title="Número de vuelos",
-        title="Vuelos por día"
+        title=title,
+        uirevision="graph_line"
     )
    
     return fig
 
-def graph_add_line(df_add, fig, name):
+def graph_add_line(df_add, fig, name, x):
     """
-    Agrega una línea adicional a un gráfico existente que muestra el número de vuelos por día.
+    Agrega una línea adicional a un gráfico existente que muestra el número de vuelos por intervalo de tiempo.
 
     Parameters:
-    - df_add (DataFrame): Un DataFrame de pandas que contiene información sobre vuelos, incluyendo una columna "day" y "num_flights".
+    - df_add (DataFrame): Un DataFrame de pandas con la columna "num_flights" para cada intervalo de `x`,
+      NaN en los intervalos que no se dibujan.
     - fig (Figure): Un objeto de figura de Plotly al que se le agregará la línea.
     - name (str): El nombre de la línea que se mostrará en la leyenda del gráfico.
+    - x (ndarray): El inicio de cada intervalo en milisegundos, el mismo array para todas las líneas.
 
     Returns:
     - None: La función modifica el objeto de figura existente en lugar de devolver uno nuevo.
     """
     fig.add_trace(
-        go.Scatter(
-            x=df_add["day"],
-            y=df_add["num_flights"],
+        go.Scattergl(
+            x=x,
+            y=df_add["num_flights"].to_numpy(),
             mode="lines+markers",
             hovertemplate=("day: %{x}<br> num_flights: %{y}<br>"),
+            # Los huecos (NaN) se unen, igual que si no estuvieran los intervalos sin vuelos
+            connectgaps=True,
             name=name
         )
     )
 
 
-@st.cache_data
-def graph_line(df):
+def graph_line(df, df_continents, aggregates=None, period="day"):
     """
-    Crea una gráfica de líneas que muestra la evolución diaria del número de vuelos,
+    Crea una gráfica de líneas que muestra la evolución del número de vuelos por hora, día o semana,
     desglosada por continente de origen o destino.
 
     Parameters
     - df : DataFrame con la información de vuelos. Debe contener una columna que identifique 
          la fecha (por ejemplo 'day') y una columna que identifique el aeropuerto de origen o destino.
+         Para la resolución por horas tienen que ser los vuelos (de `hourly_flights`), con la columna 'hour'.
+    - df_continents : DataFrame de aeropuertos filtrado, se dibuja una línea por cada continente que queda
+    - aggregates : Agregados sin filtros precalculados (de `load_aggregates`). Si se dan no se recorre `df`
+    - period : Resolución de la serie, "hour", "day" o "week"
 
     Returns
     - Gráfico de líneas interactivo con la serie temporal total de vuelos y las líneas por continente.
@@ -273,247 +344,512 @@ def graph_line(df):
     Notas
     -----
     Esta función:
-    - Utiliza `count_flights_per_day(df)` para contar vuelos por día.
-    - Usa `graph_df_total_line(df)` para crear la figura base.
-    - Filtra los datos por continente usando `do_filter("continent", ...)`.
+    - Usa `graph_df_total_line(...)` con el total de `count_flights_per_period(df, period)` para crear la figura base.
+    - Cuenta los vuelos de todos los continentes de una pasada con `count_flights_per_period_by_continent(...)`.
     - Agrega las líneas individuales por continente mediante `graph_add_line(...)`.
     """
 
-    df_count = count_flights_per_day(df)
-    fig_scatter = graph_df_total_line(df)
-
-    for continent in df_continents["continent"].unique():
-        df_filtered, _ = do_filter("continent", continent, df, df_continents)
-        df_count = count_flights_per_day(df_filtered)
-        graph_add_line(df_count, fig_scatter, continent)
+    if aggregates is not None:
+        df_total_count = aggregates[f"flights_per_{period}"]
+        df_count_continents = aggregates[f"flights_per_{period}_by_continent"]
+    else:
+        with stage(f"agregación por {period}"):
+            df_total_count = count_flights_per_period(df, period)
+        with stage(f"agregación por {period} y continente"):
+            df_count_continents = count_flights_per_period_by_continent(
+                df, df_continents["continent"].cat.categories, period)
+
+    label = {value: key for key, value in line_periods.items()}[period]
+    with stage("figura total"):
+        # Todas las líneas usan los intervalos del total, asi las x se calculan una sola vez
+        x = hours_to_milliseconds(df_total_count["time"])
+        fig_scatter = graph_df_total_line(df_total_count, x, f"Vuelos por {label.lower()}")
+
+    with stage("figura por continente"):
+        df_count_continents = df_count_continents.reindex(df_total_count["time"].to_numpy(), fill_value=0)
+        for continent in df_continents["continent"].unique():
+            num_flights = df_count_continents[continent]
+            # Igual que en el total, solo se dibujan los intervalos con algun vuelo
+            df_count = pd.DataFrame({"num_flights": num_flights.where(num_flights > 0)})
+            graph_add_line(df_count, fig_scatter, continent, x)
 
     # Una funcion adicional que me ha salido al usar un elemento "or" a la hora de filtrar, es que te muestra 
     # tanto los vuelos de ida o vuelata del contiente filtrada como los vuelos de ida/vuelta hacia ese contienente
 
     return fig_scatter
 
-@st.cache_data
-def mapmundi(df, df_continents):
+def mapmundi(df, df_continents, mode="origin", aggregates=None):
     """
     Genera un mapa coroplético (choropleth map) que muestra el número total de vuelos 
-    originados por país en el mundo.
+    originados (o con destino) por país en el mundo.
 
     Parameters
     ----------
-    - df : DataFrame con datos de vuelos. Debe contener una columna 'origin' con los códigos ICAO 
-           de los aeropuertos de origen de cada vuelo.
+    - df : DataFrame con datos de vuelos. Debe contener las columnas 'origin' y 'destination' con los ids
+           de los aeropuertos de origen y destino de cada vuelo.
 
     - df_continents : DataFrame con información geográfica de los aeropuertos
 
+    - mode : "origin", "destination" o "both", ver `count_flights_by_country`
+
+    - aggregates : Agregados sin filtros precalculados (de `load_aggregates`). Si se dan no se recorre `df`
+
     Returns
     plotly.graph_objects.Figure
         Figura interactiva de Plotly que representa un mapa mundial con intensidad de color 
-        proporcional al número de vuelos originados por país.
+        proporcional al número de vuelos de cada país.
 
     """
-    df = count_flights_by_country_origin(df, df_continents)
-    fig = px.choropleth(
-    df,
-    locations="country_name",
-    locationmode="country names",  
-    color="num_flights",   
-    hover_data={"num_flights": True} , 
-    color_continuous_scale="Blues")
+    # plotly.express tarda en importarse y solo se usa aqui, asi no retrasa la primera pagina
+    import plotly.express as px
+
+    if aggregates is not None:
+        df = aggregates[f"flights_by_country_{mode}"]
+    else:
+        with stage("agregación por país"):
+            df = count_flights_by_country(df, df_continents, mode)
+
+    with stage("figura del mapa"):
+        fig = px.choropleth(
+        df,
+        locations="country_name",
+        locationmode="country names",  
+        color="num_flights",   
+        hover_data={"num_flights": True} , 
+        color_continuous_scale="Blues")
 
     return fig
 
-#---------------------------------------------------------------------------------------
-# Realización de calculos iniciales:
-# Cargamos los df originales
-df, df_continents = load_data()
 
+def show_table(name, df, rows_for, decode=None):
+    """
+    Muestra una tabla por páginas. Solo se envía al navegador la página elegida; el orden y las
+    columnas se eligen aquí y se resuelven en el servidor.
 
-# ---------------------------------------------------------------------------
-# Sidebar
+    Parameters:
+    - name (str): Nombre de la tabla, se usa en las claves de los widgets.
+    - df (DataFrame): La tabla completa (sin filtrar).
+    - rows_for (function): Función que recibe la columna por la que ordenar (o None) y si el orden es
+      ascendente, y devuelve las posiciones de las filas a mostrar, como `table_rows`.
+    - decode (function): Función opcional que recibe la página y la devuelve lista para mostrar.
+    """
+    st.markdown(f"#### {name}")
+    col_columns, col_sort, col_order, col_size = st.columns([40, 20, 10, 10])
+    with col_columns:
+        columns = st.multiselect("Columnas", list(df.columns), default=list(df.columns), key=f"{name}_columns")
+    with col_sort:
+        sort_column = st.selectbox("Ordenar por", [""] + list(df.columns), key=f"{name}_sort")
+    with col_order:
+        ascending = st.radio("Orden", ["Asc", "Desc"], key=f"{name}_order") == "Asc"
+    with col_size:
+        page_size = st.selectbox("Filas", [25, 50, 100, 500], key=f"{name}_page_size")
+
+    rows = rows_for(sort_column or None, ascending)
+    n_pages = max(1, -(-len(rows) // page_size))
+
+    # Si los filtros dejan menos páginas, se vuelve a la ultima que existe
+    page_key = f"{name}_page"
+    if st.session_state.get(page_key, 1) > n_pages:
+        st.session_state[page_key] = n_pages
+    page = st.number_input(f"Página (de {n_pages})", min_value=1, max_value=n_pages, key=page_key)
+
+    start = (page - 1) * page_size
+    df_page = df.iloc[rows[start:start + page_size]][columns]
+    if decode is not None:
+        df_page = decode(df_page)
+
+    st.caption(f"Filas {min(start + 1, len(rows))}-{start + len(df_page)} de {len(rows)}")
+    st.dataframe(df_page)
+
+
+def save_warmup_status(status):
+    """
+    Escribe el estado de la precarga en `warmup_file`, con `atomic_write` para que quien lo lea nunca
+    lo encuentre a medias.
 
-st.markdown("""
-    <style>
-        [data-testid="stSidebar"] {
-            min-width: 400px;
-            width: 400px;
-        }
-    </style>
-""", unsafe_allow_html=True)
+    Parameters:
+    - status (dict): El estado de la precarga.
+    """
+    with atomic_write(warmup_file) as tmp:
+        with open(tmp, "w") as f:
+            json.dump(status, f, indent=2)
 
-st.sidebar.title("Dataframes a mostrar en la pantalla")
 
-# Checkboxes para saber que dataframes mostrar abajo
-list_df = [ "df", "df_continents"]
-checkbox = dict()
-for name in list_df:
-    checkbox[name] = st.sidebar.checkbox(name)
+def warmup_finished(pid, path=warmup_file):
+    """
+    Comprueba si ha terminado la precarga del servidor con el pid `pid`.
 
+    Parameters:
+    - pid (int): El pid del proceso de Streamlit.
+    - path (str): El fichero de estado de la precarga.
 
-    
-st.sidebar.title("Filtrado")
+    Returns:
+    - bool: True si el fichero existe, lo ha escrito ese proceso y la precarga ha terminado.
+    """
+    if not os.path.exists(path):
+        return False
 
-# Inicializamos lista de filtros si no existe
-if "filtros" not in st.session_state:
-    st.session_state.filtros = []
+    with open(path) as f:
+        status = json.load(f)
+    return status.get("pid") == pid and status["state"] == "done"
 
 
+def warmup_step(status, lock, name, compute):
+    """
+    Ejecuta un paso de la precarga y apunta en el estado cuánto ha tardado.
 
-button_add_filter, button_filter, button_delete_filter = n_columns_sidebar(n_elems=3, 
-    list_elems=[lambda: st.button("Añadir filtro"),
-                lambda: st.button("Realizar filtro"),
-                lambda: st.button("Borrar filtros")]
-)
+    Parameters:
+    - status (dict): El estado de la precarga, se modifica.
+    - lock (Lock): Protege `status`, que lo modifican varios hilos.
+    - name (str): Nombre del paso.
+    - compute (function): Función sin argumentos que hace el paso.
 
-# Si el botón "Añadir filtro" fue presionado, activa el filtro
-if button_add_filter:
-    # Añadir un filtro vacío (puedes personalizar valores por defecto)
-    st.session_state.filtros.append({"columna": None, "comparacion": None, "valor": None})
+    Returns:
+    - El resultado de `compute()`.
+    """
+    start = time.perf_counter()
+    result = compute()
 
-if button_delete_filter:
-    st.session_state.filtros = []
+    with lock:
+        status["steps"][name] = round(time.perf_counter() - start, 3)
+        status["done"] += 1
+        save_warmup_status(status)
+    return result
 
 
-st.sidebar.markdown("--------------------")
+def run_warmup(status, lock, data_future, cache):
+    """
+    Espera a que se carguen los datos y calcula en paralelo las gráficas sin filtros, guardandolas en
+    la cache compartida con la misma clave que usan las sesiones.
 
+    Parameters:
+    - status (dict): El estado de la precarga, se modifica.
+    - lock (Lock): Protege `status`.
+    - data_future (Future): La carga de datos de `start_loading_data`.
+    - cache (ResultCache): La cache de resultados compartida.
+    """
+    try:
+        df, df_continents, df_cube, version = warmup_step(status, lock, "load_data", data_future.result)
+
+        aggregates = load_aggregates(version)
+        tasks = {"graph_line_day": lambda: graph_line(df_cube, df_continents, aggregates)}
+        for mode in map_modes.values():
+            tasks[f"mapmundi_{mode}"] = functools.partial(mapmundi, df_cube, df_continents, mode, aggregates)
+
+        with ThreadPoolExecutor(max_workers=warmup_workers) as executor:
+            futures = [executor.submit(warmup_step, status, lock, name, functools.partial(
+                           cache.get_or_compute, result_key(name, version, []), compute))
+                       for name, compute in tasks.items()]
+            for future in futures:
+                future.result()
+
+        state = "done"
+    except Exception as error:
+        state = f"error: {error!r}"
+
+    with lock:
+        status["state"] = state
+        status["elapsed"] = round(time.time() - status["started"], 3)
+        save_warmup_status(status)
+
+    # Igual que la carga de datos, una precarga fallida no se guarda: la siguiente ejecución del script la
+    # vuelve a empezar y el fichero de estado puede llegar a "done" en este mismo proceso
+    if state != "done":
+        start_warmup.clear()
+
+
+@st.cache_resource(show_spinner=False)
+def start_warmup():
+    """
+    Empieza la precarga una sola vez por proceso, en cuanto se ejecuta el script por primera vez:
+    carga los datos y calcula las gráficas sin filtros en segundo plano, para que la primera sesión
+    solo tenga que leerlas de la cache. El progreso se puede consultar en `warmup_file`.
 
-col_filtrado = [""] + ["Continente", "Pais", "Día"]
-continent_filtrado = [""] + df_continents["continent"].unique()
-country_filtrado = df_continents["country_name"].unique()
-day_filtrado = df["day"].unique()
+    Returns:
+    - dict: El estado de la precarga ("state", "pid", "done", "total", tiempo de cada paso en "steps"...).
+      Se actualiza mientras avanza.
+    """
+    # El pid distingue el estado de este proceso del que haya dejado uno anterior en el mismo fichero
+    status = {"state": "running", "pid": os.getpid(), "started": time.time(), "done": 0,
+              "total": 2 + len(map_modes), "steps": dict()}
+    lock = threading.Lock()
+    save_warmup_status(status)
 
-select_col = {"Continente": continent_filtrado,
-              "Pais": country_filtrado,
-              "Día": day_filtrado}
+    # Las funciones con cache de Streamlit se llaman desde aqui y no desde el hilo
+    thread = threading.Thread(target=run_warmup, args=(status, lock, start_loading_data(), get_result_cache()),
+                              daemon=True)
+    thread.start()
+    return status
 
 
+#-----------------------------------------------------------------------------------------
+# Pagina principal
+# Solo cuando Streamlit ejecuta el script; al importarlo (por ejemplo desde las pruebas de rendimiento)
+# se usan las funciones sin levantar la interfaz
+if __name__ == "__main__":
+    st.set_page_config(layout="wide", initial_sidebar_state="expanded")
 
-for i, diccionary in enumerate(st.session_state.filtros):
-    columna_key = f"columna_{i}"
-    comparacion_key = f"comparacion_{i}"
-    elemento_key = f"elemento_{i}"
+    st.markdown("""
+        <style>
+            html, body, [data-testid="stApp"] {
+                height: 100vh;
+            }
+
+            .block-container {
+                padding-top: 1rem;
+                padding-bottom: 1rem;
+                height: 100vh;
+            }
+
+            .main {
+                height: 100%;
+            }
+
+            /* Opcional: elimina el espacio de header/footer */
+            header, footer, #MainMenu {
+                visibility: hidden;
+            }
+        </style>
+    """, unsafe_allow_html=True)
+
+    # La primera ejecución del proceso empieza la precarga de los datos y de las gráficas
+    warmup_status = start_warmup()
+
+    if "intro" not in st.session_state:
+        st.session_state.intro = False
+
+    # Parte introductoria del trabajo. Mientras se lee, la precarga sigue en segundo plano
+    if not st.session_state.intro:
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("## ✈️ Visualización de Vuelos")
+        with col2:
+            st.write("")
+            siguiente = st.button("Siguiente", type="primary", key="1", help="Pulsa dos veces")
 
     
+        st.markdown("""
+            Esta aplicación ha sido desarrollada con el objetivo de representar, a través de varias gráficas, la cantidad de vuelos registrados a nivel mundial durante un período específico, permitiendo además aplicar filtros personalizados e iterativos según los intereses del usuario.
 
-    diccionary["columna"] = st.sidebar.selectbox("Elige una columna", col_filtrado, key=columna_key)
+            ###  Fuentes de datos
 
-    if not st.session_state.get(columna_key):
-        break
-    # Solo mostramos el tipo de comparación si se eligió una columna
-    elif st.session_state.get(columna_key) == "Día":
-        diccionary["comparacion"] = st.sidebar.selectbox("Elige un tipo de comparación", ["", "=", "<", ">"], key=comparacion_key)
+            Los datos principales utilizados provienen del conjunto público relacionado con el descenso de vuelos durante la pandemia de COVID-19 en 2020. En concreto, se ha utilizado el dataset:
 
+            - [flightlist_20200301_20200331.csv.gz](https://zenodo.org/records/7923702) — descargado desde Zenodo.
 
-        if not st.session_state.get(comparacion_key):
-            break
-        # Solo mostramos el valor si se eligió la comparación
-        elif st.session_state.get(comparacion_key):
-            col_seleccionada = st.session_state.get(columna_key)
-            opciones = select_col.get(col_seleccionada, [])
-            diccionary["valor"] = st.sidebar.selectbox("Elige un valor", opciones, key=elemento_key)
+            Para enriquecer y contextualizar los datos, se han empleado también los siguientes conjuntos de apoyo:
 
-    else: 
-        comparacion_key=None
-        col_seleccionada = st.session_state.get(columna_key)
-        opciones = select_col.get(col_seleccionada, [])
-        diccionary["valor"] = st.sidebar.selectbox("Elige un valor", opciones, key=elemento_key)
+            - [airport-codes.csv](https://datahub.io/core/airport-codes/r/airport-codes.csv): contiene información de aeropuertos a nivel global.
+            - [country-list.csv](https://datahub.io/core/country-list/r/data.csv): utilizado para normalizar los nombres de los países en inglés.
 
-    st.sidebar.markdown("--------------------")
+            ---
 
-if button_filter:
+            ##  Funcionalidades principales
 
-    for i, elem in enumerate(st.session_state.filtros):
-        if elem["columna"] == "Día":
-            df = filter_day(df, elem["comparacion"], elem["valor"])
-        
-        elif elem["columna"] == "Pais":
-            df, df_continents = do_filter("country_name", elem["valor"], df, df_continents)
+            ###  Sistema de filtrado interactivo
 
-        elif elem["columna"] == "Continente":
-            df, df_continents = do_filter("continent", elem["valor"], df, df_continents)
-        
-    
+            Se ha implementado un sistema de filtrado altamente flexible que permite:
 
-#-----------------------------------------------------------------------------------------
-# Pagina principal
-if "intro" not in st.session_state:
-    st.session_state.intro = False
-
-# Parte introductoria del trabajo
-if not st.session_state.intro:
-    col1, col2 = st.columns(2)
-    with col1:
-        st.markdown("## ✈️ Visualización de Vuelos")
-    with col2:
-        st.write("")
-        siguiente = st.button("Siguiente", type="primary", key="1", help="Pulsa dos veces")
+            - Añadir filtros de forma manual y personalizada.
+            - Eliminar todos los filtros aplicados sin necesidad de recargar la aplicación.
+            - Ejecutar el filtrado de datos únicamente cuando el usuario lo indique.
+            - Visualizar y configurar progresivamente cada filtro en función de las opciones seleccionadas previamente.
+
+            ---
+
+            ###  Gráfico de líneas con marcadores
+
+            Se incluye una visualización lineal con marcadores que, aunque no es interactiva, permite observar de manera clara la evolución del número total de vuelos con origen o destino en cada continente. Cada punto del gráfico incluye información detallada al pasar el cursor sobre él.
+
+            ---
+
+            ##  Mapa coroplético
+
+            El mapa coroplético permite visualizar la distribución geográfica de los vuelos a nivel país, coloreando cada territorio en función del número de vuelos que han llegado o partido desde él. Esta visualización facilita una interpretación clara del impacto del tráfico aéreo por región.
+            """)
+
+        siguiente2 = st.button("Siguiente", type="primary", key="2", help="Pulsa dos veces")
+
+        if siguiente or siguiente2:
+            st.session_state.intro = True
+
+        # Hasta que se pasa la introducción no hace falta nada más
+        st.stop()
+
+
+    #---------------------------------------------------------------------------------------
+    # Realización de calculos iniciales:
+    # La instrumentación se activa con la variable de entorno o con ?profile=1 en la URL
+    profile_run = profile_enabled or st.query_params.get("profile") == "1"
+    if profile_run:
+        start_profiling(memory=profile_enabled)
+
+    # Cargamos los df originales
+    with stage("carga de datos"):
+        df, df_continents, df_cube, version = load_data()
+    # Los ficheros nuevos de la carpeta de datos nuevos se añaden en cada ejecución, sin volver a cargar nada.
+    # La version cambia con cada lote, asi que los resultados de la cache de antes no se reutilizan
+    with stage("datos nuevos"):
+        live = get_live_flights(version, df, df_continents, df_cube).refresh()
+    version = live["version"]
+    df_index = live["flights"][0][1]
+    # Los filtros van recortando df_continents, pero para pasar de id a codigo ICAO hace falta la tabla completa
+    df_airports = df_continents
+
+
+    # ---------------------------------------------------------------------------
+    # Sidebar
 
-    
     st.markdown("""
-        Esta aplicación ha sido desarrollada con el objetivo de representar, a través de varias gráficas, la cantidad de vuelos registrados a nivel mundial durante un período específico, permitiendo además aplicar filtros personalizados e iterativos según los intereses del usuario.
+        <style>
+            [data-testid="stSidebar"] {
+                min-width: 400px;
+                width: 400px;
+            }
+        </style>
+    """, unsafe_allow_html=True)
 
-        ###  Fuentes de datos
+    st.sidebar.title("Dataframes a mostrar en la pantalla")
 
-        Los datos principales utilizados provienen del conjunto público relacionado con el descenso de vuelos durante la pandemia de COVID-19 en 2020. En concreto, se ha utilizado el dataset:
+    # Checkboxes para saber que dataframes mostrar abajo
+    list_df = [ "df", "df_continents"]
+    checkbox = dict()
+    for name in list_df:
+        checkbox[name] = st.sidebar.checkbox(name)
 
-        - [flightlist_20200301_20200331.csv.gz](https://zenodo.org/records/7923702) — descargado desde Zenodo.
 
-        Para enriquecer y contextualizar los datos, se han empleado también los siguientes conjuntos de apoyo:
+    
+    st.sidebar.title("Filtrado")
 
-        - [airport-codes.csv](https://datahub.io/core/airport-codes/r/airport-codes.csv): contiene información de aeropuertos a nivel global.
-        - [country-list.csv](https://datahub.io/core/country-list/r/data.csv): utilizado para normalizar los nombres de los países en inglés.
+    # Inicializamos lista de filtros si no existe
+    if "filtros" not in st.session_state:
+        st.session_state.filtros = []
 
-        ---
 
-        ##  Funcionalidades principales
+    button_add_filter, button_filter, button_delete_filter = n_columns_sidebar(n_elems=3, 
+        list_elems=[lambda: st.button("Añadir filtro"),
+                    lambda: st.button("Realizar filtro"),
+                    lambda: st.button("Borrar filtros")]
+    )
 
-        ###  Sistema de filtrado interactivo
+    # Si el botón "Añadir filtro" fue presionado, activa el filtro
+    if button_add_filter:
+        # Añadir un filtro vacío (puedes personalizar valores por defecto)
+        st.session_state.filtros.append({"columna": None, "comparacion": None, "valor": None})
 
-        Se ha implementado un sistema de filtrado altamente flexible que permite:
+    if button_delete_filter:
+        st.session_state.filtros = []
 
-        - Añadir filtros de forma manual y personalizada.
-        - Eliminar todos los filtros aplicados sin necesidad de recargar la aplicación.
-        - Ejecutar el filtrado de datos únicamente cuando el usuario lo indique.
-        - Visualizar y configurar progresivamente cada filtro en función de las opciones seleccionadas previamente.
 
-        ---
+    st.sidebar.markdown("--------------------")
 
-        ###  Gráfico de líneas con marcadores
 
-        Se incluye una visualización lineal con marcadores que, aunque no es interactiva, permite observar de manera clara la evolución del número total de vuelos con origen o destino en cada continente. Cada punto del gráfico incluye información detallada al pasar el cursor sobre él.
+    col_filtrado = [""] + ["Continente", "Pais", "Día", "Fechas"]
+    continent_filtrado = list(df_continents["continent"].unique())
+    country_filtrado = df_continents["country_name"].unique()
+    # Las fechas que hay salen del indice de fechas, sin recorrer los vuelos
+    day_filtrado = live["days"]
+    first_date, last_date = days_to_dates(day_filtrado[[0, -1]]).tolist() if len(day_filtrado) else (None, None)
 
-        ---
+    select_col = {"Continente": continent_filtrado,
+                  "Pais": country_filtrado,
+                  "Día": day_filtrado}
 
-        ##  Mapa coroplético
 
-        El mapa coroplético permite visualizar la distribución geográfica de los vuelos a nivel país, coloreando cada territorio en función del número de vuelos que han llegado o partido desde él. Esta visualización facilita una interpretación clara del impacto del tráfico aéreo por región.
-        """)
+    for i, diccionary in enumerate(st.session_state.filtros):
+        columna_key = f"columna_{i}"
+        comparacion_key = f"comparacion_{i}"
+        elemento_key = f"elemento_{i}"
 
-    siguiente2 = st.button("Siguiente", type="primary", key="2", help="Pulsa dos veces")
+    
 
-    if siguiente or siguiente2:
-        st.session_state.intro = True
+        diccionary["columna"] = st.sidebar.selectbox("Elige una columna", col_filtrado, key=columna_key)
 
+        if not st.session_state.get(columna_key):
+            break
+        # Solo mostramos el tipo de comparación si se eligió una columna
+        elif st.session_state.get(columna_key) == "Día":
+            diccionary["comparacion"] = st.sidebar.selectbox("Elige un tipo de comparación", ["", "=", "<", ">"], key=comparacion_key)
+
+
+            if not st.session_state.get(comparacion_key):
+                break
+            # Solo mostramos el valor si se eligió la comparación
+            elif st.session_state.get(comparacion_key):
+                col_seleccionada = st.session_state.get(columna_key)
+                opciones = select_col.get(col_seleccionada, [])
+                diccionary["valor"] = st.sidebar.selectbox("Elige un valor", opciones, key=elemento_key,
+                                                           format_func=lambda day: str(days_to_dates(day)))
+
+        elif st.session_state.get(columna_key) == "Fechas":
+            comparacion_key = None
+            fechas = st.sidebar.date_input("Elige un rango de fechas", (first_date, last_date), min_value=first_date,
+                                           max_value=last_date, key=elemento_key)
+            # Mientras solo se ha elegido la primera fecha del rango el filtro no hace nada
+            diccionary["comparacion"] = "entre"
+            diccionary["valor"] = (date_to_day(fechas[0]), date_to_day(fechas[1])) if len(fechas) == 2 else None
+
+        else: 
+            comparacion_key=None
+            col_seleccionada = st.session_state.get(columna_key)
+            opciones = select_col.get(col_seleccionada, [])
+            diccionary["valor"] = st.sidebar.selectbox("Elige un valor", opciones, key=elemento_key)
 
+        st.sidebar.markdown("--------------------")
+
+    # Los filtros solo se aplican en la ejecución en la que se pulsa el botón
+    filtros_aplicados = st.session_state.filtros if button_filter else []
+    # Sin filtros las gráficas salen de los agregados precalculados por el motor, si los hay
+    aggregates = None if filters_key(filtros_aplicados) else live["aggregates"]
+
+    # La tabla de aeropuertos es pequeña y se filtra siempre. Las gráficas trabajan sobre la tabla agregada,
+    # que solo se filtra si algun resultado no está en la cache; la de vuelos solo si se va a mostrar
+    with stage("filtros de paises y continentes"):
+        _, df_continents = compile_filters(filtros_aplicados, df_continents)
+
+    # Con los agregados no se recorre ninguna tabla, asi que solo se filtra cuando no los hay. Si no, con
+    # lotes nuevos se juntarian todos los trozos (copiando el almacen compartido) en cada fallo de la cache
+    @functools.cache
+    def filtered_cube():
+        if aggregates is not None:
+            return None
+        return filter_pieces(live["cubes"], df_airports, filtros_aplicados)
+
+    def line_source(period):
+        if aggregates is not None:
+            return None
+        # La tabla agregada no tiene la hora, la serie por horas sale de los vuelos
+        if period == "hour":
+            return hourly_flights(filter_pieces(live["flights"], df_airports, filtros_aplicados), df_airports)
+        return filtered_cube()
+    
 
-# Pestaña del trabajo
-elif st.session_state.intro:
+    # Pestaña del trabajo
     if "help" not in st.session_state:
         st.session_state.help = [False, False]
 
     col1_fil1, col2_fil1 = st.columns([90, 17])
-    with col1_fil1:
-        graphic_lines = graph_line(df)
-        st.plotly_chart(graphic_lines, use_container_width=True)
-
+    # La columna de la derecha va primero porque en ella se elige la resolución de la gráfica
     with col2_fil1:
         st.markdown("<h2 style='margin-top: 4rem; font-size: 32px;'>Evolución de vuelos</h2>", unsafe_allow_html=True)
         help_evolution = st.button("ℹ️", help="Este gráfico muestra el número de vuelos por continente.")
         if help_evolution:
             st.session_state.help[0] = not st.session_state.help[0]
-        
+    
         if st.session_state.help[0]:
             st.write("Muestra el sumatorio de de los vuelos que han tenido como origen un determinado continente, más los vuelos que han tenido como destino un determinado continente")
 
+        line_period = line_periods[st.radio("Resolución", list(line_periods), index=1, key="line_period")]
+
+    with col1_fil1:
+        with stage("gráfica de líneas"):
+            graphic_lines = cached_result(f"graph_line_{line_period}", filtros_aplicados,
+                                          lambda: graph_line(line_source(line_period), df_continents, aggregates,
+                                                             line_period))
+        record_payload("gráfica de líneas", graphic_lines)
+        # La clave fija hace que Streamlit reutilice el mismo grafico en el navegador entre ejecuciones
+        st.plotly_chart(graphic_lines, use_container_width=True, key="graph_line")
+
 
     col1_fil2, col2_fil2 = st.columns([17, 90])
     with col1_fil2:
@@ -525,13 +861,52 @@ elif st.session_state.intro:
         if st.session_state.help[1]:
             st.write("Muestra el sumatorio de de los vuelos que han tenido como origen un determinado país, más los vuelos que han tenido como destino un determinado país")
 
+        map_mode = map_modes[st.radio("Vuelos", list(map_modes), index=2, key="map_mode")]
+
     with col2_fil2:
-        graphic_map = mapmundi(df, df_continents)
+        with stage("mapa"):
+            graphic_map = cached_result(f"mapmundi_{map_mode}", filtros_aplicados,
+                                        lambda: mapmundi(filtered_cube(), df_continents, map_mode, aggregates))
+        record_payload("mapa", graphic_map)
         st.plotly_chart(graphic_map)
 
 
-    dictionary_dataframes = {"df": df, "df_continents": df_continents}
-    for names in list_df:
-        if checkbox[names]:
-            st.dataframe(dictionary_dataframes[names])
-
+    cache_stats = get_result_cache().stats()
+    st.sidebar.caption(f"Cache de gráficas: {cache_stats['hits']} aciertos, {cache_stats['misses']} fallos, "
+                       f"{cache_stats['entries']} resultados ({cache_stats['bytes'] / 2**20:.1f} MB)")
+    if warmup_status["state"] != "done":
+        st.sidebar.caption(f"Precarga: {warmup_status['done']}/{warmup_status['total']} pasos ({warmup_status['state']})")
+    if live["appended"]:
+        st.sidebar.caption(f"Datos nuevos: {live['appended']:,} vuelos añadidos desde {incoming_dir}")
+    for file, error in live["errors"].items():
+        st.sidebar.warning(f"No se ha podido añadir {file}: {error}")
+
+    # Las tablas se muestran por páginas, solo si se marca la casilla. La de vuelos es la de los datos
+    # cargados, sin los lotes nuevos. Sus filas (filtradas y ordenadas) se guardan en la cache y solo
+    # la página elegida pasa a codigos ICAO
+    if checkbox["df"]:
+        with stage("tabla df"):
+            show_table("df", df,
+                       lambda sort_column, ascending: cached_result(
+                           f"table_df_{sort_column}_{ascending}", filtros_aplicados,
+                           lambda: flight_table_rows(df, df_airports, filtros_aplicados, sort_column, ascending,
+                                                     df_index)),
+                       decode=lambda df_page: decode_days(decode_airports(df_page, df_airports)))
+
+    if checkbox["df_continents"]:
+        show_table("df_continents", df_airports,
+                   lambda sort_column, ascending: table_rows(
+                       df_airports.index.isin(df_continents.index),
+                       sort_key(df_airports[sort_column]) if sort_column else None, ascending))
+
+    # Panel de instrumentación, con las etapas de esta ejecución
+    if profile_run:
+        stages = finish_profiling({"filters": filters_key(filtros_aplicados), "map_mode": map_mode,
+                                   "line_period": line_period})
+        with st.sidebar.expander("Instrumentación"):
+            st.dataframe(pd.DataFrame([{"etapa": "· " * elem["depth"] + elem["stage"],
+                                        "segundos": elem.get("seconds"),
+                                        "memoria (MB)": elem.get("memory_mb"),
+                                        "bytes enviados": elem.get("bytes")} for elem in stages]),
+                         hide_index=True)
+            st.caption(f"Guardado en {profile_log}")
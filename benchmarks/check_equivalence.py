@@ -0,0 +1,374 @@
+import argparse
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+import cleaning_dataset
+import flights_engine
+from generate_flights import (generate_continents, generate_flights, generate_raw_coordinates, generate_raw_flights,
+                              generate_routes)
+
+# Comprueba que las funciones optimizadas del motor dan lo mismo que las versiones originales de la aplicación
+# (copiadas aqui tal cual, con los aeropuertos como codigos ICAO) sobre datos sinteticos
+
+
+# ---------------------------------------------------------------------------
+# Versiones originales
+
+def baseline_count_flights_per_day(df):
+    df_count = pd.DataFrame()
+    df_count["num_flights"] = df["day"].value_counts().sort_index()
+    df_count["day"] = df_count.index
+
+    return df_count
+
+
+def baseline_count_flights_by_country_origin(df, df_continents):
+    df_count = df["origin"].value_counts().reset_index()
+    df_count.columns = ["origin", "num_flights"]
+    df_merge = pd.merge(df_count, df_continents, left_on="origin", right_on="icao_code", how="left")
+    df_sum = df_merge.groupby("country_name")["num_flights"].sum().reset_index()
+
+    return df_sum
+
+
+def baseline_filter_df_continent(df_continents, col, elem):
+    df_continents_filt = df_continents[df_continents[col]==elem]
+    return df_continents_filt
+
+
+def baseline_filter_df(df, df_continents_filt):
+    df_filt = df[df["origin"].isin(df_continents_filt["icao_code"]) | df["destination"].isin(df_continents_filt["icao_code"])]
+    return df_filt
+
+
+def baseline_do_filter(col, elem, df_filtered, df_continents_filtered):
+    df_continents_filtered = baseline_filter_df_continent(df_continents_filtered, col, elem)
+    df_filt = baseline_filter_df(df_filtered, df_continents_filtered)
+    return df_filt, df_continents_filtered
+
+
+def baseline_filter_day(df, type_filter, day):
+    if type_filter == "=":
+        df = df[df["day"]==day]
+
+    elif type_filter == "<":
+        df = df[df["day"]<day]
+
+    elif type_filter == ">":
+        df = df[df["day"]>day]
+
+    return df
+
+
+def baseline_apply_filters(df, df_continents, filtros):
+    """
+    Aplica los filtros uno detras de otro, como hacía la barra lateral original.
+    """
+    for elem in filtros:
+        if elem["columna"] == "Día":
+            df = baseline_filter_day(df, elem["comparacion"], elem["valor"])
+
+        elif elem["columna"] == "Pais":
+            df, df_continents = baseline_do_filter("country_name", elem["valor"], df, df_continents)
+
+        elif elem["columna"] == "Continente":
+            df, df_continents = baseline_do_filter("continent", elem["valor"], df, df_continents)
+
+    return df, df_continents
+
+
+def baseline_num_vuelos_ida_vuelta(df):
+    contador_viajes = dict()
+
+    for elem in df["Journeys"]:
+        if elem in contador_viajes:
+            contador_viajes[elem]+=1
+
+        else:
+            elem_split = elem.split("-")
+            elem_reverse = elem_split[1]+"-"+elem_split[0]
+
+            if elem_reverse in contador_viajes:
+                contador_viajes[elem_reverse]+=1
+
+            else:
+                contador_viajes[elem]=1
+
+    df_result = pd.DataFrame([{"Journeys": k, "Num vuelos": v} for k, v in contador_viajes.items()])
+    df_result = pd.merge(df_result, df[["Journeys", "Source airport", "Destination airport"]], on="Journeys", how="left")
+    return df_result
+
+
+def baseline_parse_day(df):
+    """
+    La limpieza original del día: un `apply` por vuelo que se queda con el día del mes.
+    """
+    df["day"] = df["day"].apply(lambda x: int(x.split()[0].split("-")[2]))
+    return df
+
+
+def baseline_parse_coordinates(df_continents):
+    """
+    La limpieza original de las coordenadas: dos `apply` por aeropuerto.
+    """
+    df_continents["latitud"] = df_continents["coordinates"].apply(lambda x: float(x.split(",")[0]))
+    df_continents["longitud"] = df_continents["coordinates"].apply(lambda x: float(x.split(",")[1]))
+    return df_continents
+
+
+# ---------------------------------------------------------------------------
+# Comprobaciones
+
+def decode_icao(df, df_continents):
+    """
+    Cambia los ids de aeropuerto de los vuelos por sus codigos ICAO, como los tenía la aplicación original.
+
+    Parameters:
+    - df (DataFrame): Los vuelos de `generate_flights`.
+    - df_continents (DataFrame): Los aeropuertos de `generate_continents`.
+
+    Returns:
+    - DataFrame: Los vuelos con "origin" y "destination" como codigos ICAO (None si el id es -1).
+    """
+    # El id -1 cae en la ultima casilla
+    codes = np.append(df_continents["icao_code"].to_numpy(dtype=object), None)
+    return df.assign(origin=codes[df["origin"].to_numpy()], destination=codes[df["destination"].to_numpy()])
+
+
+def random_filters(df, df_continents, rng, max_filters=5):
+    """
+    Genera una lista de filtros de la barra lateral al azar: días, paises y continentes mezclados. Como en la
+    barra lateral, los paises y continentes se eligen entre los aeropuertos que dejan los filtros anteriores.
+
+    Parameters:
+    - df (DataFrame): Los vuelos.
+    - df_continents (DataFrame): Los aeropuertos.
+    - rng (Generator): El generador de números aleatorios.
+    - max_filters (int): Número máximo de filtros.
+
+    Returns:
+    - list: Los filtros, con las claves "columna", "comparacion" y "valor".
+    """
+    days = np.unique(df["day"].to_numpy())
+    filtros = list()
+
+    for _ in range(rng.integers(1, max_filters + 1)):
+        column = rng.choice(["Día", "Pais", "Continente"])
+        if column == "Día":
+            filtros.append({"columna": "Día", "comparacion": str(rng.choice(["=", "<", ">"])),
+                            "valor": int(rng.choice(days))})
+        else:
+            col = flights_engine.filter_columns[column]
+            values = df_continents[col].dropna().unique()
+            if len(values) == 0:
+                continue
+            value = rng.choice(values)
+            df_continents = df_continents[df_continents[col] == value]
+            filtros.append({"columna": str(column), "comparacion": None, "valor": value})
+
+    return filtros
+
+
+def check_filters(df, df_continents, n_cases, rng):
+    """
+    Compara el plan de filtros (`apply_filters`) con los filtros originales aplicados en cadena, con los
+    vuelos y con la tabla agregada.
+
+    Parameters:
+    - df (DataFrame): Los vuelos.
+    - df_continents (DataFrame): Los aeropuertos, indexados por id.
+    - n_cases (int): Número de listas de filtros al azar.
+    - rng (Generator): El generador de números aleatorios.
+
+    Returns:
+    - list: Los fallos encontrados.
+    """
+    df_icao = decode_icao(df, df_continents)
+    df_cube = flights_engine.build_flight_cube(df)
+    errors = list()
+
+    for _ in range(n_cases):
+        filtros = random_filters(df, df_continents, rng)
+        expected, expected_continents = baseline_apply_filters(df_icao, df_continents, filtros)
+
+        got, got_continents = flights_engine.apply_filters(df, df_continents, filtros)
+        if not got.index.equals(expected.index) or not got_continents.index.equals(expected_continents.index):
+            errors.append(f"apply_filters[df] {filtros}: {len(got)} vuelos y {len(got_continents)} aeropuertos "
+                          f"en vez de {len(expected)} y {len(expected_continents)}")
+
+        got = flights_engine.count_flights_per_period(flights_engine.apply_filters(df_cube, df_continents, filtros)[0])
+        expected = baseline_count_flights_per_day(expected)
+        if got["num_flights"].tolist() != expected["num_flights"].tolist() or \
+                got["time"].tolist() != (expected["day"] * 24).tolist():
+            errors.append(f"apply_filters[df_cube] {filtros}: los vuelos por día no coinciden")
+
+    return errors
+
+
+def check_continents(df, df_continents):
+    """
+    Compara los vuelos por día de cada continente de una pasada (`count_flights_per_period_by_continent`)
+    con el bucle original, que filtraba los vuelos de cada continente por separado.
+
+    Parameters:
+    - df (DataFrame): Los vuelos.
+    - df_continents (DataFrame): Los aeropuertos, indexados por id.
+
+    Returns:
+    - list: Los fallos encontrados.
+    """
+    df_icao = decode_icao(df, df_continents)
+    continents = df_continents["continent"].cat.categories
+    inputs = {"df": flights_engine.add_flight_continents(df.copy(), df_continents),
+              "df_cube": flights_engine.add_flight_continents(flights_engine.build_flight_cube(df), df_continents)}
+    errors = list()
+
+    for input_name, data in inputs.items():
+        counts = flights_engine.count_flights_per_period_by_continent(data, continents, "day")
+        for continent in df_continents["continent"].unique():
+            expected = baseline_count_flights_per_day(baseline_do_filter("continent", continent, df_icao, df_continents)[0])
+            got = counts[continent][counts[continent] > 0]
+            if got.tolist() != expected["num_flights"].tolist() or got.index.tolist() != (expected["day"] * 24).tolist():
+                errors.append(f"count_flights_per_period_by_continent[{input_name}] {continent}: no coincide")
+
+    return errors
+
+
+def check_countries(df, df_continents):
+    """
+    Compara los vuelos por país del mapa (`count_flights_by_country`) con las versiones originales. El modo
+    "origin" (y "destination", cambiando las columnas) con el conteo original por país de origen, y el
+    modo "both" con el filtro original de cada país, que ya contaba los vuelos con origen o destino en él.
+
+    Parameters:
+    - df (DataFrame): Los vuelos.
+    - df_continents (DataFrame): Los aeropuertos, indexados por id.
+
+    Returns:
+    - list: Los fallos encontrados.
+    """
+    df_icao = decode_icao(df, df_continents)
+    swapped = df_icao.rename(columns={"origin": "destination", "destination": "origin"})
+    expected = {"origin": baseline_count_flights_by_country_origin(df_icao, df_continents),
+                "destination": baseline_count_flights_by_country_origin(swapped, df_continents)}
+    expected["both"] = pd.DataFrame({
+        "country_name": df_continents["country_name"].cat.categories,
+        "num_flights": [len(baseline_do_filter("country_name", country, df_icao, df_continents)[0])
+                        for country in df_continents["country_name"].cat.categories]})
+
+    inputs = {"df": df, "df_cube": flights_engine.build_flight_cube(df)}
+    errors = list()
+
+    for input_name, data in inputs.items():
+        for mode in flights_engine.country_modes:
+            got = flights_engine.count_flights_by_country(data, df_continents, mode)
+            want = expected[mode][expected[mode]["num_flights"] > 0]
+            if dict(zip(got["country_name"], got["num_flights"])) != dict(zip(want["country_name"], want["num_flights"])):
+                errors.append(f"count_flights_by_country[{input_name},{mode}]: no coincide")
+
+    return errors
+
+
+def check_journeys(n_routes, df_continents, seed):
+    """
+    Compara los trayectos de ida y vuelta (`num_vuelos_ida_vuelta`) con el bucle original.
+
+    Parameters:
+    - n_routes (int): Número de rutas.
+    - df_continents (DataFrame): Los aeropuertos de `generate_continents`.
+    - seed (int): Semilla de los números aleatorios.
+
+    Returns:
+    - list: Los fallos encontrados.
+    """
+    _, df_routes = generate_routes(n_routes, df_continents, seed=seed)
+    df_trips = flights_engine.build_trips(df_routes)
+
+    got = flights_engine.num_vuelos_ida_vuelta(df_trips)
+    expected = baseline_num_vuelos_ida_vuelta(df_trips)
+    if not got.equals(expected[got.columns].astype(got.dtypes)):
+        return [f"num_vuelos_ida_vuelta: no coincide ({len(got)} pares, {len(expected)} esperados)"]
+    return []
+
+
+def check_cleaning(n_rows, df_continents, n_days, seed):
+    """
+    Compara la limpieza vectorizada (`clean_flights` y `parse_coordinates`) con los `apply` originales.
+    El día original era el día del mes, asi que se compara con el día del mes de la fecha limpia.
+
+    Parameters:
+    - n_rows (int): Número de vuelos y de coordenadas.
+    - df_continents (DataFrame): Los aeropuertos de `generate_continents`.
+    - n_days (int): Número de días.
+    - seed (int): Semilla de los números aleatorios.
+
+    Returns:
+    - list: Los fallos encontrados.
+    """
+    raw = generate_raw_flights(n_rows, df_continents, n_days, seed=seed)
+    errors = list()
+
+    got = cleaning_dataset.clean_flights(raw.copy(), pd.Index(df_continents["icao_code"]))
+    expected = baseline_parse_day(raw.copy())
+    if pd.DatetimeIndex(flights_engine.days_to_dates(got["day"])).day.tolist() != expected["day"].tolist():
+        errors.append("clean_flights: el día no coincide")
+
+    coordinates = generate_raw_coordinates(n_rows, seed)
+    got = cleaning_dataset.parse_coordinates(coordinates)
+    expected = baseline_parse_coordinates(pd.DataFrame({"coordinates": coordinates}))
+    if not got.equals(expected[["latitud", "longitud"]]):
+        errors.append("parse_coordinates: no coincide")
+
+    return errors
+
+
+def run(n_rows, n_airports, n_days, n_cases, seed):
+    """
+    Hace todas las comprobaciones y muestra el resultado de cada una.
+
+    Parameters:
+    - n_rows (int): Número de vuelos (y de rutas).
+    - n_airports, n_days, seed: Parametros de los datos sinteticos.
+    - n_cases (int): Número de listas de filtros al azar.
+
+    Returns:
+    - bool: True si todas coinciden.
+    """
+    df_continents = generate_continents(n_airports, n_countries=50, seed=seed)
+    df_continents = df_continents.astype(flights_engine.continent_dtypes)
+    df_continents.index.name = "airport_id"
+    df = generate_flights(n_rows, n_airports, n_days, seed=seed)
+    rng = np.random.default_rng(seed)
+
+    checks = {"filtros": lambda: check_filters(df, df_continents, n_cases, rng),
+              "continentes": lambda: check_continents(df, df_continents),
+              "paises": lambda: check_countries(df, df_continents),
+              "ida y vuelta": lambda: check_journeys(n_rows, df_continents, seed),
+              "limpieza": lambda: check_cleaning(n_rows, df_continents, n_days, seed)}
+
+    ok = True
+    for name, check in checks.items():
+        errors = check()
+        print(f"{name:<15} {'ok' if not errors else f'{len(errors)} fallos'}")
+        for error in errors:
+            print(f"  {error}")
+        ok = ok and not errors
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Comprueba que las funciones optimizadas dan lo mismo que las "
+                                                 "originales con datos sinteticos")
+    parser.add_argument("--rows", type=int, default=20_000, help="Número de vuelos y de rutas")
+    parser.add_argument("--airports", type=int, default=500, help="Número de aeropuertos")
+    parser.add_argument("--days", type=int, default=31, help="Número de días")
+    parser.add_argument("--cases", type=int, default=50, help="Número de listas de filtros al azar")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla de los números aleatorios")
+    args = parser.parse_args()
+
+    sys.exit(0 if run(args.rows, args.airports, args.days, args.cases, args.seed) else 1)
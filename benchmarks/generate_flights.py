@@ -0,0 +1,217 @@
+import argparse
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# Los benchmarks se ejecutan desde la raiz del repositorio o desde esta carpeta
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cleaning_dataset import compact_continents, compact_flights, continent_names, formats, save_df
+
+# Tipos de aeropuerto que quedan en df_continents después de la limpieza
+airport_types = ["large_airport", "medium_airport", "small_airport"]
+
+letters = np.array(list("ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+
+
+def letter_codes(numbers, length):
+    """
+    Convierte números en codigos de letras de longitud fija (0 -> "AAA", 1 -> "AAB"...).
+
+    Parameters:
+    - numbers (ndarray): Los números, distintos entre si para que los codigos tambien lo sean.
+    - length (int): Número de letras de cada codigo.
+
+    Returns:
+    - ndarray: Un array de strings con los codigos.
+    """
+    digits = [letters[(numbers // 26 ** position) % 26] for position in reversed(range(length))]
+    return np.array(["".join(code) for code in zip(*digits)], dtype=object)
+
+
+def popularity(n_airports, skew, rng):
+    """
+    Calcula la probabilidad de que cada aeropuerto aparezca en un vuelo. Sigue una ley de Zipf:
+    el aeropuerto en la posición k tiene un peso de 1 / k**skew, y las posiciones se reparten al azar.
+
+    Parameters:
+    - n_airports (int): Número de aeropuertos.
+    - skew (float): Cuanto se concentran los vuelos en pocos aeropuertos, con 0 todos son igual de probables.
+    - rng (Generator): Generador de números aleatorios.
+
+    Returns:
+    - ndarray: Las probabilidades, que suman 1.
+    """
+    weights = 1 / np.arange(1, n_airports + 1) ** skew
+    weights = rng.permutation(weights)
+    return weights / weights.sum()
+
+
+def generate_continents(n_airports=5000, n_countries=200, seed=0):
+    """
+    Genera una tabla de aeropuertos con el mismo esquema que df_continents de `cleaning_dataset.py`.
+
+    Parameters:
+    - n_airports (int): Número de aeropuertos. Los codigos IATA son de 3 letras, asi que como mucho 26**3.
+    - n_countries (int): Número de paises entre los que se reparten los aeropuertos.
+    - seed (int): Semilla de los números aleatorios.
+
+    Returns:
+    - DataFrame: Los aeropuertos, con un codigo ICAO y uno IATA distinto cada uno.
+    """
+    if n_airports > 26 ** 3:
+        raise ValueError(f"Como mucho hay {26 ** 3} codigos IATA distintos")
+
+    rng = np.random.default_rng(seed)
+
+    # Cada país está en un continente y cada aeropuerto en un país
+    iso_countries = letter_codes(np.arange(n_countries), 2)
+    country_continents = rng.choice(list(continent_names.values()), n_countries)
+    countries = rng.integers(0, n_countries, n_airports)
+
+    df_continents = pd.DataFrame({
+        "type": rng.choice(airport_types, n_airports),
+        "continent": country_continents[countries],
+        "iso_country": iso_countries[countries],
+        "icao_code": letter_codes(rng.permutation(26 ** 4)[:n_airports], 4),
+        "iata_code": letter_codes(rng.permutation(26 ** 3)[:n_airports], 3),
+        "latitud": rng.uniform(-90, 90, n_airports),
+        "longitud": rng.uniform(-180, 180, n_airports),
+        "country_name": np.array([f"Country {code}" for code in iso_countries], dtype=object)[countries],
+    })
+    return compact_continents(df_continents)
+
+
+def generate_flights(n_rows, n_airports=5000, n_days=31, skew=1.0, unknown=0.01, seed=0, start="2020-03-01"):
+    """
+    Genera una tabla de vuelos con el mismo esquema que df de `cleaning_dataset.py`: el id de los aeropuertos
+    de origen y destino (su posición en df_continents, o -1 si no se conoce), la fecha como número de días
+    desde el 1970-01-01 (ordenada por fecha como en el almacen del motor) y la hora del vuelo en ese día.
+
+    Parameters:
+    - n_rows (int): Número de vuelos.
+    - n_airports (int): Número de aeropuertos (las filas de df_continents).
+    - n_days (int): Número de días, los vuelos se reparten en los `n_days` días desde `start`.
+    - skew (float): Exponente de la ley de Zipf de `popularity`.
+    - unknown (float): Fracción de aeropuertos de origen y de destino que no están en df_continents.
+    - seed (int): Semilla de los números aleatorios.
+    - start (str): Primera fecha de los vuelos.
+
+    Returns:
+    - DataFrame: Los vuelos, con las columnas "origin", "destination", "day" y "hour".
+    """
+    rng = np.random.default_rng(seed)
+    probabilities = popularity(n_airports, skew, rng)
+
+    origin = rng.choice(n_airports, n_rows, p=probabilities)
+    destination = rng.choice(n_airports, n_rows, p=probabilities)
+    origin[rng.random(n_rows) < unknown] = -1
+    destination[rng.random(n_rows) < unknown] = -1
+
+    first_day = np.datetime64(start, "D").astype(np.int64)
+    day = np.sort(rng.integers(first_day, first_day + n_days, n_rows))
+
+    hour = rng.integers(0, 24, n_rows)
+
+    df = pd.DataFrame({"origin": origin, "destination": destination, "day": day, "hour": hour})
+    return compact_flights(df)
+
+
+def generate_raw_flights(n_rows, df_continents, n_days=31, skew=1.0, unknown=0.01, seed=0, start="2020-03-01"):
+    """
+    Genera vuelos con el formato de los ficheros originales (flightlist), para medir la limpieza: los
+    aeropuertos como codigos ICAO y "firstseen" y "day" como texto ("2020-03-01 09:12:00+00:00").
+
+    Parameters:
+    - n_rows (int): Número de vuelos.
+    - df_continents (DataFrame): Los aeropuertos de `generate_continents`.
+    - n_days, skew, unknown, seed, start: Ver `generate_flights`.
+
+    Returns:
+    - DataFrame: Los vuelos, con las columnas "origin", "destination", "firstseen" y "day".
+    """
+    df = generate_flights(n_rows, len(df_continents), n_days, skew, unknown, seed, start)
+    rng = np.random.default_rng(seed)
+
+    # El id -1 (aeropuerto desconocido) cae en la ultima casilla, vacia
+    icao = np.append(df_continents["icao_code"].to_numpy(dtype=object), None)
+
+    # Hay pocos minutos y días distintos, solo se les da formato a esos
+    minutes = (df["day"].to_numpy().astype(np.int64) * 24 + df["hour"].to_numpy()) * 60 + rng.integers(0, 60, n_rows)
+    codes, uniques = pd.factorize(minutes)
+    firstseen = pd.to_datetime(uniques, unit="m").strftime("%Y-%m-%d %H:%M:%S+00:00").to_numpy(dtype=object)[codes]
+    codes, uniques = pd.factorize(df["day"].to_numpy())
+    day = pd.to_datetime(uniques, unit="D").strftime("%Y-%m-%d 00:00:00+00:00").to_numpy(dtype=object)[codes]
+
+    return pd.DataFrame({"origin": icao[df["origin"].to_numpy()],
+                         "destination": icao[df["destination"].to_numpy()],
+                         "firstseen": firstseen,
+                         "day": day})
+
+
+def generate_raw_coordinates(n_rows, seed=0):
+    """
+    Genera una columna de coordenadas con el formato del dataset de aeropuertos original ("latitud, longitud").
+
+    Parameters:
+    - n_rows (int): Número de aeropuertos.
+    - seed (int): Semilla de los números aleatorios.
+
+    Returns:
+    - Series: Las coordenadas como texto.
+    """
+    rng = np.random.default_rng(seed)
+    latitud = rng.uniform(-90, 90, n_rows).round(6).astype(str)
+    longitud = rng.uniform(-180, 180, n_rows).round(6).astype(str)
+    return pd.Series(np.char.add(np.char.add(latitud, ", "), longitud), name="coordinates")
+
+
+def generate_routes(n_rows, df_continents, skew=1.0, seed=0):
+    """
+    Genera las tablas que usa `app.py`: las rutas de OpenFlights (por codigo IATA) y los aeropuertos
+    con su posición.
+
+    Parameters:
+    - n_rows (int): Número de rutas.
+    - df_continents (DataFrame): Los aeropuertos de `generate_continents`.
+    - skew (float): Exponente de la ley de Zipf de `popularity`.
+    - seed (int): Semilla de los números aleatorios.
+
+    Returns:
+    - tuple: df_airports (con las columnas "IATA", "Latitude" y "Longitude") y df_routes
+      (con "Source airport" y "Destination airport").
+    """
+    rng = np.random.default_rng(seed)
+    iata = df_continents["iata_code"].to_numpy(dtype=object)
+    probabilities = popularity(len(iata), skew, rng)
+
+    df_airports = pd.DataFrame({"IATA": iata,
+                                "Latitude": df_continents["latitud"].to_numpy(),
+                                "Longitude": df_continents["longitud"].to_numpy()})
+    df_routes = pd.DataFrame({"Source airport": iata[rng.choice(len(iata), n_rows, p=probabilities)],
+                              "Destination airport": iata[rng.choice(len(iata), n_rows, p=probabilities)]})
+    return df_airports, df_routes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera un dataset de vuelos sintetico para probar la aplicación")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Número de vuelos")
+    parser.add_argument("--airports", type=int, default=5000, help="Número de aeropuertos")
+    parser.add_argument("--countries", type=int, default=200, help="Número de paises")
+    parser.add_argument("--days", type=int, default=31, help="Número de días")
+    parser.add_argument("--start", default="2020-03-01", help="Primera fecha de los vuelos")
+    parser.add_argument("--skew", type=float, default=1.0,
+                        help="Concentración de los vuelos en pocos aeropuertos (0 = uniforme)")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla de los números aleatorios")
+    parser.add_argument("--output-dir", default=".", help="Carpeta donde se guardan df y df_continents")
+    parser.add_argument("--format", choices=formats, default="parquet", help="Formato de los ficheros de salida")
+    args = parser.parse_args()
+
+    df_continents = generate_continents(args.airports, args.countries, args.seed)
+    df = generate_flights(args.rows, args.airports, args.days, args.skew, seed=args.seed, start=args.start)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    save_df(df, os.path.join(args.output_dir, "df"), args.format)
+    save_df(df_continents, os.path.join(args.output_dir, "df_continents"), args.format)
+    print(f"{len(df)} vuelos y {len(df_continents)} aeropuertos guardados en {args.output_dir}")
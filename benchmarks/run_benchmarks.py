@@ -0,0 +1,263 @@
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+import app_covid
+import cleaning_dataset
+import flights_engine
+from check_equivalence import baseline_parse_coordinates, baseline_parse_day
+from generate_flights import (generate_continents, generate_flights, generate_raw_coordinates, generate_raw_flights,
+                              generate_routes)
+
+# Tamaños (número de vuelos) con los que se mide cada función
+sizes = [100_000, 1_000_000, 10_000_000]
+
+# Carpeta donde se guardan los resultados, un fichero por commit
+results_dir = os.path.join(root, "benchmarks", "results")
+
+
+def app_covid_cases(df, df_continents):
+    """
+    Prepara las funciones del dashboard (`app_covid.py` y las del motor que usa) a medir, sobre la tabla
+    de vuelos y sobre la tabla agregada.
+
+    Parameters:
+    - df (DataFrame): Los vuelos de `generate_flights`.
+    - df_continents (DataFrame): Los aeropuertos de `generate_continents`.
+
+    Returns:
+    - dict: Funciones sin argumentos, con el nombre del caso como clave.
+    """
+    df_continents = df_continents.astype(flights_engine.continent_dtypes)
+    df_continents.index.name = "airport_id"
+    continent = df_continents["continent"].iloc[0]
+    # Los primeros 14 días, como el filtro "<" de la barra lateral
+    day = int(df["day"].iloc[0]) + 14
+
+    inputs = {"df": flights_engine.add_flight_continents(df.copy(), df_continents),
+              "df_cube": flights_engine.add_flight_continents(flights_engine.build_flight_cube(df), df_continents)}
+
+    continents = df_continents["continent"].cat.categories
+    cases = {"build_flight_cube": lambda: flights_engine.build_flight_cube(df),
+             # La resolución por horas solo se puede calcular con los vuelos
+             "count_flights_per_period_by_continent[df,hour]":
+                 lambda: flights_engine.count_flights_per_period_by_continent(inputs["df"], continents, "hour"),
+             # Añadir un lote de tamaño fijo tiene que costar lo mismo con cualquier tamaño de datos
+             "LiveFlights.append[10000]": live_append(df, inputs["df_cube"], df_continents)}
+    for input_name, data in inputs.items():
+        cases.update({
+            f"count_flights_per_period[{input_name}]": lambda data=data: flights_engine.count_flights_per_period(data),
+            f"count_flights_per_period_by_continent[{input_name},week]":
+                lambda data=data: flights_engine.count_flights_per_period_by_continent(data, continents, "week"),
+            f"count_flights_by_country_origin[{input_name}]":
+                lambda data=data: flights_engine.count_flights_by_country_origin(data, df_continents),
+            f"do_filter[{input_name}]":
+                lambda data=data: flights_engine.do_filter("continent", continent, data, df_continents),
+            f"filter_day[{input_name}]": lambda data=data: flights_engine.filter_day(data, "<", day),
+            f"graph_line[{input_name}]": lambda data=data: app_covid.graph_line(data, df_continents),
+            f"mapmundi[{input_name}]": lambda data=data: app_covid.mapmundi(data, df_continents, "origin"),
+        })
+    return cases
+
+
+def live_append(df, df_cube, df_continents, batch_rows=10_000):
+    """
+    Prepara la medida de añadir un lote de vuelos nuevos a los vuelos cargados.
+
+    Parameters:
+    - df (DataFrame): Los vuelos de `generate_flights`.
+    - df_cube (DataFrame): Los vuelos agregados, con las columnas de continente.
+    - df_continents (DataFrame): Los aeropuertos, ya tipados.
+    - batch_rows (int): Número de vuelos del lote.
+
+    Returns:
+    - function: Función sin argumentos que añade el lote a unos vuelos vivos recien creados.
+    """
+    live = flights_engine.LiveFlights(df, df_cube, df_continents, "benchmark")
+    batch = df.iloc[:batch_rows]
+    return lambda: live.append(batch)
+
+
+def app_cases(n_rows, df_continents, skew, seed):
+    """
+    Prepara las funciones de las rutas de `app.py` (en el motor) a medir, con la tabla de trayectos que
+    construye la aplicación.
+
+    Parameters:
+    - n_rows (int): Número de rutas.
+    - df_continents (DataFrame): Los aeropuertos de `generate_continents`.
+    - skew (float): Exponente de la ley de Zipf de los aeropuertos.
+    - seed (int): Semilla de los números aleatorios.
+
+    Returns:
+    - dict: Funciones sin argumentos, con el nombre del caso como clave.
+    """
+    df_airports, df_routes = generate_routes(n_rows, df_continents, skew, seed)
+    df_trips = flights_engine.build_trips(df_routes)
+    df_ida_vuelta = flights_engine.num_vuelos_ida_vuelta(df_trips)
+    index = flights_engine.airport_index(df_airports)
+
+    return {"num_vuelos_ida_vuelta": lambda: flights_engine.num_vuelos_ida_vuelta(df_trips),
+            "airport_index": lambda: flights_engine.airport_index(df_airports),
+            "unir_pos_geografica": lambda: flights_engine.unir_pos_geografica(df_ida_vuelta, df_airports, index=index)}
+
+
+def cleaning_cases(n_rows, df_continents, n_days, skew, seed):
+    """
+    Prepara la limpieza a medir (`cleaning_dataset.py`) sobre vuelos y coordenadas con el formato de los
+    ficheros originales, junto a los `apply` por fila que usaba antes (ver `check_equivalence.py`).
+
+    Parameters:
+    - n_rows (int): Número de vuelos y de coordenadas.
+    - df_continents (DataFrame): Los aeropuertos de `generate_continents`.
+    - n_days (int): Número de días.
+    - skew (float): Exponente de la ley de Zipf de los aeropuertos.
+    - seed (int): Semilla de los números aleatorios.
+
+    Returns:
+    - dict: Funciones sin argumentos, con el nombre del caso como clave.
+    """
+    raw = generate_raw_flights(n_rows, df_continents, n_days, skew, seed=seed)
+    airports = pd.Index(df_continents["icao_code"])
+    coordinates = generate_raw_coordinates(n_rows, seed)
+    df_coordinates = pd.DataFrame({"coordinates": coordinates})
+
+    # Las dos versiones modifican el DataFrame, asi que las dos trabajan sobre una copia
+    return {"clean_flights": lambda: cleaning_dataset.clean_flights(raw.copy(), airports),
+            "baseline.day_apply": lambda: baseline_parse_day(raw.copy()),
+            "parse_coordinates": lambda: cleaning_dataset.parse_coordinates(coordinates),
+            "baseline.coordinates_apply": lambda: baseline_parse_coordinates(df_coordinates.copy())}
+
+
+def measure(compute, repeat):
+    """
+    Ejecuta una función varias veces y mide cuánto tarda.
+
+    Parameters:
+    - compute (function): Función sin argumentos.
+    - repeat (int): Número de ejecuciones.
+
+    Returns:
+    - dict: El mejor tiempo, la mediana y todos los tiempos, en segundos.
+    """
+    times = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        compute()
+        times.append(time.perf_counter() - start)
+    return {"best": min(times), "median": statistics.median(times), "times": times}
+
+
+def run(sizes, repeat, n_airports, n_days, skew, seed, pattern):
+    """
+    Mide todas las funciones con cada tamaño de datos.
+
+    Parameters:
+    - sizes (list): Números de vuelos (y de rutas) a probar.
+    - repeat (int): Ejecuciones de cada función.
+    - n_airports, n_days, skew, seed: Parametros de los datos sinteticos.
+    - pattern (str): Solo se miden los casos cuyo nombre cumple este patrón (fnmatch).
+
+    Returns:
+    - list: Un diccionario por caso y tamaño.
+    """
+    df_continents = generate_continents(n_airports, seed=seed)
+    results = list()
+
+    for n_rows in sizes:
+        df = generate_flights(n_rows, n_airports, n_days, skew, seed=seed)
+        groups = {"app_covid": lambda: app_covid_cases(df, df_continents),
+                  "app": lambda: app_cases(n_rows, df_continents, skew, seed),
+                  "cleaning": lambda: cleaning_cases(n_rows, df_continents, n_days, skew, seed)}
+
+        for module, make_cases in groups.items():
+            cases = {f"{module}.{name}": compute for name, compute in make_cases().items()
+                     if fnmatch.fnmatch(f"{module}.{name}", pattern)}
+            for name, compute in cases.items():
+                result = {"case": name, "rows": n_rows, **measure(compute, repeat)}
+                print(f"{name:<55} {n_rows:>11,} {result['best']:>9.4f} s", flush=True)
+                results.append(result)
+
+    return results
+
+
+def git_commit():
+    """
+    Returns:
+    - str: El commit actual del repositorio (con "-dirty" si hay cambios sin guardar), o None si no hay git.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{commit}-dirty" if dirty else commit
+
+
+def compare(old_file, new_file):
+    """
+    Muestra cuánto ha cambiado el mejor tiempo de cada caso entre dos ficheros de resultados.
+
+    Parameters:
+    - old_file (str): Fichero de resultados de referencia.
+    - new_file (str): Fichero de resultados a comparar.
+    """
+    with open(old_file) as f:
+        old = {(r["case"], r["rows"]): r["best"] for r in json.load(f)["results"]}
+    with open(new_file) as f:
+        new = {(r["case"], r["rows"]): r["best"] for r in json.load(f)["results"]}
+
+    for key in sorted(old.keys() & new.keys()):
+        case, n_rows = key
+        print(f"{case:<55} {n_rows:>11,} {old[key]:>9.4f} s -> {new[key]:>9.4f} s  x{old[key] / new[key]:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mide el rendimiento de las funciones de la aplicación con datos sinteticos")
+    parser.add_argument("--sizes", type=int, nargs="+", default=sizes, help="Números de vuelos a probar")
+    parser.add_argument("--repeat", type=int, default=3, help="Ejecuciones de cada función")
+    parser.add_argument("--airports", type=int, default=5000, help="Número de aeropuertos")
+    parser.add_argument("--days", type=int, default=31, help="Número de días")
+    parser.add_argument("--skew", type=float, default=1.0, help="Concentración de los vuelos en pocos aeropuertos")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla de los números aleatorios")
+    parser.add_argument("--filter", default="*", help="Solo mide los casos cuyo nombre cumple este patrón, "
+                                                      "por ejemplo 'app_covid.graph_line*'")
+    parser.add_argument("--output", help="Fichero JSON de resultados, por defecto benchmarks/results/<commit>.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="No mide nada, compara dos ficheros de resultados")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit()
+
+    commit = git_commit()
+    results = run(args.sizes, args.repeat, args.airports, args.days, args.skew, args.seed, args.filter)
+
+    output = args.output or os.path.join(results_dir, f"{commit or 'unknown'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"commit": commit,
+                   "date": datetime.now(timezone.utc).isoformat(),
+                   "python": platform.python_version(),
+                   "pandas": pd.__version__,
+                   "numpy": np.__version__,
+                   "machine": platform.machine(),
+                   "config": {"repeat": args.repeat, "airports": args.airports, "days": args.days,
+                              "skew": args.skew, "seed": args.seed},
+                   "results": results}, f, indent=2)
+    print(f"Resultados guardados en {output}")
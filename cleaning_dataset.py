@@ -1,45 +1,57 @@
+import argparse
+import glob
+import hashlib
+import itertools
+import json
+import os
+import re
+import shutil
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 import pandas as pd
-import gzip
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from flights_engine import atomic_write, manifest_file
 
 # Datos de vuelos
 file = "flightlist_20200301_20200331.csv.gz"
 
-with gzip.open(file, 'rt') as f:
-    df = pd.read_csv(f)
-
-# Guardo el dataset de los continentes y paises
-url_continents = "https://datahub.io/core/airport-codes/r/airport-codes.csv"
-df_continents = pd.read_csv(url_continents)
-
-
-# Elimino las columnas que no son necesarias
-df_continents.drop(["ident", "name", "elevation_ft", "iso_region", "municipality", "gps_code", "local_code"], axis=1, inplace=True)
-
-# Parece ser que donde pone NaN en verdad es NA
-df_continents["continent"] = df_continents["continent"].fillna("NA")
+# De los vuelos solo nos interesan estas columnas, el resto ni siquiera se leen del fichero
+flight_columns = ["origin", "destination", "firstseen", "day"]
 
-# Elimino las filas que no tienen codigo ICAO
-df_continents = df_continents[df_continents["icao_code"].notna()]
+# Número de filas que se leen de golpe en el modo streaming
+chunksize = 500_000
 
-# Elimino las filas que no tienen codigo IATA
-df_continents = df_continents[df_continents["iata_code"].notna()]
+# Formatos de salida soportados. Los columnares guardan los continentes y paises como diccionarios
+# (categorias) y la fecha como un entero (días desde el 1970-01-01)
+formats = ["csv", "parquet", "feather"]
 
-# Elimino aquellos que no sean aeropuertos
-df_continents = df_continents[~df_continents["type"].isin(["heliport", "seaplane_base"])]
+# Esquema con el que se escriben los trozos de vuelos en parquet, tiene que ser el mismo en todos.
+# Los aeropuertos se guardan con su id: la posición de su fila en df_continents (-1 si no está)
+flight_schema = pa.schema([
+    ("origin", pa.int32()),
+    ("destination", pa.int32()),
+    ("day", pa.int32()),
+    ("hour", pa.int8()),
+])
 
-# Tambien voy a cambiar la forma en que se muestra la latitud y longitud
-df_continents["latitud"] = df_continents["coordinates"].apply(lambda x: float(x.split(",")[0]))
-df_continents["longitud"] = df_continents["coordinates"].apply(lambda x: float(x.split(",")[1]))
-
-# Elimino la columna de coordenadas
-df_continents.drop(["coordinates"], axis=1, inplace=True)
-
-# Para renombrar los paises usare un dataframe de soporte
+# Datasets de los continentes y paises
+url_continents = "https://datahub.io/core/airport-codes/r/airport-codes.csv"
 url_iso = "https://datahub.io/core/country-list/r/data.csv"
-df_iso = pd.read_csv(url_iso)  
 
-df_continents = df_continents.merge(df_iso, left_on='iso_country', right_on='Code', how='left')
-df_continents = df_continents.rename(columns={'Name': 'country_name'}).drop(columns=['Code'])
+# Carpeta donde se guarda una copia local de los datasets de referencia y sus versiones ya procesadas.
+# Si se copian aqui los CSV a mano la limpieza funciona sin conexion
+reference_dir = "reference"
+# Version de la construcción de la tabla de aeropuertos (`build_continents`). Entra en el nombre de su snapshot,
+# asi que hay que subirla cada vez que cambia la tabla que se construye para no leer un snapshot antiguo
+continents_version = 2
+
+# Tiempo acumulado (en segundos) de cada etapa de la limpieza
+timings = dict()
 
 # Tambien voy a renombrar los continentes para que sean mas amigables
 continent_names = {
@@ -51,22 +63,739 @@ continent_names = {
     'OC': 'Oceania',
     'SA': 'South America'
 }
-df_continents['continent'] = df_continents['continent'].replace(continent_names)
 
 
-# Como sabemos que es de un mes y solo son dias, voy a quitar toda la informacion irrelevante
-df["day"] = df["day"].apply(lambda x: int(x.split()[0].split("-")[2]))
+@contextmanager
+def timed(step):
+    """
+    Mide el tiempo que tarda el bloque y lo suma al de la etapa `step` en `timings`.
+
+    Parameters:
+    - step (str): Nombre de la etapa.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[step] = timings.get(step, 0) + time.perf_counter() - start
+
+
+def report_timings(n_rows, elapsed):
+    """
+    Muestra por pantalla el tiempo de cada etapa y la velocidad de limpieza de los vuelos.
+    Con varios procesos el tiempo de las etapas es la suma de todos ellos.
+
+    Parameters:
+    - n_rows (int): Número de vuelos limpiados.
+    - elapsed (float): Tiempo real transcurrido en segundos.
+    """
+    for step, seconds in timings.items():
+        print(f"{step:<12} {seconds:8.2f} s")
+
+    print(f"{'total':<12} {elapsed:8.2f} s  ({n_rows / elapsed:,.0f} filas/s)")
+
+
+def fetch_reference(url, name, reference_dir=reference_dir, refresh=False, offline=False):
+    """
+    Devuelve la ruta de la copia local de un dataset de referencia, descargándolo solo si no
+    existe todavía o si se pide refrescarlo.
+
+    Parameters:
+    - url (str): Dirección desde la que se descarga el dataset.
+    - name (str): Nombre de la copia local, sin extensión.
+    - reference_dir (str): Carpeta de las copias locales.
+    - refresh (bool): Si es True se vuelve a descargar aunque ya exista la copia.
+    - offline (bool): Si es True nunca se descarga nada y la copia local tiene que existir.
+
+    Returns:
+    - str: La ruta del CSV local.
+    """
+    path = os.path.join(reference_dir, f"{name}.csv")
+
+    if os.path.exists(path) and not refresh:
+        return path
+
+    if offline:
+        raise FileNotFoundError(f"No existe la copia local {path} y no se puede descargar sin conexion")
+
+    os.makedirs(reference_dir, exist_ok=True)
+    with atomic_write(path) as tmp:
+        urllib.request.urlretrieve(url, tmp)
+    return path
+
+
+def snapshot_path(reference_dir, name, *hashes):
+    """
+    Construye la ruta de una versión ya procesada (snapshot) identificada por los hashes de los que depende.
+
+    Parameters:
+    - reference_dir (str): Carpeta de las copias locales.
+    - name (str): Nombre del dataset.
+    - hashes (str): Hashes del contenido de los ficheros de origen (y la version de la construcción, si la tiene).
+
+    Returns:
+    - str: La ruta del fichero parquet del snapshot.
+    """
+    return os.path.join(reference_dir, "-".join([name] + [h[:16] for h in hashes]) + ".parquet")
+
+
+def save_snapshot(df, path, name):
+    """
+    Guarda un snapshot en parquet y borra los anteriores del mismo dataset, que ya no sirven.
+
+    Parameters:
+    - df (DataFrame): El DataFrame a guardar.
+    - path (str): Ruta del snapshot.
+    - name (str): Nombre del dataset.
+    """
+    for old in glob.glob(os.path.join(os.path.dirname(path), f"{name}-*.parquet")):
+        os.remove(old)
+    df.to_parquet(path, index=False)
+
+
+def read_reference(path, name, sha256):
+    """
+    Lee un dataset de referencia desde su snapshot si existe, y si no parsea el CSV y guarda el snapshot.
+
+    Parameters:
+    - path (str): Ruta del CSV local.
+    - name (str): Nombre del dataset.
+    - sha256 (str): Hash del contenido del CSV.
+
+    Returns:
+    - DataFrame: El dataset leído.
+    """
+    snapshot = snapshot_path(os.path.dirname(path), name, sha256)
+    if os.path.exists(snapshot):
+        return pd.read_parquet(snapshot)
+
+    df = pd.read_csv(path)
+    save_snapshot(df, snapshot, name)
+    return df
+
+
+def load_continents(reference_dir=reference_dir, refresh=False, offline=False):
+    """
+    Obtiene la tabla de aeropuertos limpia. Si los CSV de referencia no han cambiado desde la última
+    vez se lee directamente la tabla ya construida, y si no se reconstruye a partir de ellos.
+
+    Parameters:
+    - reference_dir (str): Carpeta de las copias locales y los snapshots.
+    - refresh (bool): Si es True se vuelven a descargar los CSV de referencia.
+    - offline (bool): Si es True no se descarga nada, se usan las copias de `reference_dir`.
+
+    Returns:
+    - DataFrame: Un DataFrame con el tipo, continente, país, códigos ICAO/IATA y posición de cada aeropuerto.
+    """
+    path_continents = fetch_reference(url_continents, "airport-codes", reference_dir, refresh, offline)
+    path_iso = fetch_reference(url_iso, "country-list", reference_dir, refresh, offline)
+    hash_continents, hash_iso = file_hash(path_continents), file_hash(path_iso)
+
+    snapshot = snapshot_path(reference_dir, "df_continents", f"v{continents_version}", hash_continents, hash_iso)
+    if os.path.exists(snapshot):
+        return pd.read_parquet(snapshot)
+
+    df_continents = build_continents(read_reference(path_continents, "airport-codes", hash_continents),
+                                     read_reference(path_iso, "country-list", hash_iso))
+    save_snapshot(df_continents, snapshot, "df_continents")
+    return df_continents
+
+
+def parse_coordinates(coordinates):
+    """
+    Separa las coordenadas del dataset de aeropuertos ("latitud, longitud") en dos columnas numéricas,
+    partiendo toda la columna de una vez con pyarrow (`str.split` con expand crea un objeto por fila y es
+    más lento que el `apply` original).
+
+    Parameters:
+    - coordinates (Series): La columna "coordinates".
+
+    Returns:
+    - DataFrame: Las columnas "latitud" y "longitud" (float), con el mismo indice que `coordinates`.
+      Las coordenadas vacias quedan como NaN.
+    """
+    values = pc.fill_null(pa.array(coordinates, type=pa.string()), "nan,nan")
+    parts = pc.split_pattern(values, ",", max_splits=1)
+    # Al aplanar las listas se alternan latitud y longitud, asi que todas tienen que tener las dos partes
+    if len(parts) and pc.min(pc.list_value_length(parts)).as_py() != 2:
+        raise ValueError("Hay coordenadas sin el formato 'latitud, longitud'")
+
+    numbers = pc.cast(pc.utf8_trim_whitespace(pc.list_flatten(parts)), pa.float64()).to_numpy()
+    return pd.DataFrame({"latitud": numbers[0::2], "longitud": numbers[1::2]}, index=coordinates.index)
+
+
+def build_continents(df_continents, df_iso):
+    """
+    Limpia el dataset de aeropuertos, añadiéndole el nombre del país.
+
+    Parameters:
+    - df_continents (DataFrame): El dataset de aeropuertos tal y como se descarga.
+    - df_iso (DataFrame): El dataset con el nombre de cada país según su código ISO.
+
+    Returns:
+    - DataFrame: Un DataFrame con el tipo, continente, país, códigos ICAO/IATA y posición de cada aeropuerto.
+    """
+    # Elimino las columnas que no son necesarias
+    df_continents = df_continents.drop(["ident", "name", "elevation_ft", "iso_region", "municipality", "gps_code", "local_code"], axis=1)
+
+    # Parece ser que donde pone NaN en verdad es NA
+    df_continents["continent"] = df_continents["continent"].fillna("NA")
+
+    # Elimino las filas que no tienen codigo ICAO
+    df_continents = df_continents[df_continents["icao_code"].notna()]
+
+    # Elimino las filas que no tienen codigo IATA
+    df_continents = df_continents[df_continents["iata_code"].notna()]
+
+    # Elimino aquellos que no sean aeropuertos
+    df_continents = df_continents[~df_continents["type"].isin(["heliport", "seaplane_base"])]
+
+    # Tambien voy a cambiar la forma en que se muestra la latitud y longitud, partiendo la columna de una vez
+    coordinates = parse_coordinates(df_continents["coordinates"])
+    df_continents["latitud"] = coordinates["latitud"]
+    df_continents["longitud"] = coordinates["longitud"]
+
+    # Elimino la columna de coordenadas
+    df_continents = df_continents.drop(["coordinates"], axis=1)
+
+    # Para renombrar los paises usare un dataframe de soporte
+    df_continents = df_continents.merge(df_iso, left_on='iso_country', right_on='Code', how='left')
+    df_continents = df_continents.rename(columns={'Name': 'country_name'}).drop(columns=['Code'])
+
+    df_continents['continent'] = df_continents['continent'].replace(continent_names)
+
+    # El id de cada aeropuerto es su posición en la tabla, asi que cada codigo ICAO tiene que aparecer una vez
+    df_continents = df_continents.drop_duplicates("icao_code").reset_index(drop=True)
+
+    return df_continents
+
+
+def airports_hash(airports):
+    """
+    Calcula un hash de la lista de codigos ICAO que define los ids de los aeropuertos.
+    Si cambia, los ids de los vuelos ya limpiados dejan de ser validos.
+
+    Parameters:
+    - airports (Index): Los codigos ICAO en el orden de df_continents.
+
+    Returns:
+    - str: El hash en hexadecimal.
+    """
+    return hashlib.sha256("\n".join(airports).encode()).hexdigest()
+
+
+def clean_flights(df, airports):
+    """
+    Limpia un DataFrame (o un trozo) de vuelos que ya solo contiene las columnas de `flight_columns`.
+
+    Parameters:
+    - df (DataFrame): Un DataFrame de pandas con las columnas "origin", "destination" y "day".
+    - airports (Index): Los codigos ICAO de df_continents, en orden, para obtener el id de cada aeropuerto.
+
+    Returns:
+    - DataFrame: El mismo DataFrame con los aeropuertos como ids, la columna "day" como número de días
+      desde el 1970-01-01 y la columna "hour" con la hora de "firstseen" contada desde el principio de "day".
+    """
+    # Cada codigo ICAO se cambia por su posición en df_continents. Los aeropuertos que no estan
+    # (o vacios) se quedan con -1
+    df["origin"] = airports.get_indexer(df["origin"]).astype("int32")
+    df["destination"] = airports.get_indexer(df["destination"]).astype("int32")
+
+    # Solo son dias, asi que se quita la hora. Las fechas vienen como "2020-03-01 00:00:00+00:00" y hay
+    # muy pocas distintas, asi que solo se convierten esas y se guarda el número de días desde el 1970-01-01
+    codes, dates = pd.factorize(df["day"])
+    # factorize deja los vacios con el codigo -1, que al indexar cogería la última fecha
+    if (codes < 0).any():
+        raise ValueError(f"Hay {(codes < 0).sum()} vuelos sin 'day'")
+    dates = pd.to_datetime(dates.str.slice(0, 10), format="%Y-%m-%d").to_numpy().astype("datetime64[D]")
+    df["day"] = dates.astype("int32")[codes]
+
+    # De "firstseen" solo se guarda la hora, contada desde el principio de "day" para que quepa en un byte
+    # (normalmente 0-23, pero un vuelo se puede ver por primera vez el día anterior). Igual que con el día,
+    # solo se convierten las horas distintas ("2020-03-01 09")
+    codes, hours = pd.factorize(df.pop("firstseen").str.slice(0, 13))
+    if (codes < 0).any():
+        raise ValueError(f"Hay {(codes < 0).sum()} vuelos sin 'firstseen'")
+    hours = pd.to_datetime(hours, format="%Y-%m-%d %H").to_numpy().astype("datetime64[h]").astype("int64")
+    hours = hours[codes] - df["day"].to_numpy().astype("int64") * 24
+    # Si "firstseen" está a más de 5 días de "day" la hora no cabe en un byte, mejor fallar que guardarla mal
+    if len(hours) and (hours.min() < -128 or hours.max() > 127):
+        raise ValueError(f"Hay vuelos con 'firstseen' demasiado lejos de 'day' (de {hours.min()} a {hours.max()} horas)")
+    df["hour"] = hours.astype("int8")
+
+    # Da distintos valores de latitud y longitud para los mismos aeropuertos, por eso no se leen
+    # esas columnas y se usaran las posiciones que hay en df_continentes
+    return df
+
+
+def compact_flights(df):
+    """
+    Pasa las columnas del DataFrame de vuelos a tipos compactos.
+
+    Parameters:
+    - df (DataFrame): Un DataFrame de pandas con los vuelos ya limpios.
+
+    Returns:
+    - DataFrame: El DataFrame con "origin", "destination" y "day" como int32 y "hour" como int8.
+    """
+    return df.astype({"origin": "int32", "destination": "int32", "day": "int32", "hour": "int8"})
+
+
+def compact_continents(df_continents):
+    """
+    Pasa las columnas repetitivas del DataFrame de aeropuertos a categorias.
+
+    Parameters:
+    - df_continents (DataFrame): Un DataFrame de pandas con los aeropuertos ya limpios.
+
+    Returns:
+    - DataFrame: El DataFrame con "type", "continent", "iso_country" y "country_name" como categorias.
+    """
+    return df_continents.astype({"type": "category", "continent": "category",
+                                 "iso_country": "category", "country_name": "category"})
+
+
+def read_flights(file, airports):
+    """
+    Lee y limpia el fichero de vuelos entero de golpe.
+
+    Parameters:
+    - file (str): Ruta al fichero de vuelos (puede estar comprimido con gzip).
+    - airports (Index): Los codigos ICAO de df_continents, en orden.
+
+    Returns:
+    - DataFrame: Un DataFrame con los vuelos ya limpios.
+    """
+    with timed("lectura"):
+        df = pd.read_csv(file, usecols=flight_columns)
+
+    with timed("limpieza"):
+        df = clean_flights(df, airports)
+
+    return df
+
+
+def stream_flights(file, output, airports, chunksize=chunksize, output_format="csv"):
+    """
+    Lee el fichero de vuelos por trozos de tamaño fijo, limpia cada trozo y lo añade al fichero de salida.
+    Así la memoria usada depende del tamaño del trozo y no del tamaño del fichero.
+
+    Parameters:
+    - file (str): Ruta al fichero de vuelos (puede estar comprimido con gzip).
+    - output (str): Ruta del fichero de salida, se sobrescribe si ya existe.
+    - airports (Index): Los codigos ICAO de df_continents, en orden.
+    - chunksize (int): Número de filas que se leen en cada trozo.
+    - output_format (str): "csv" o "parquet". En parquet cada trozo se escribe como un row group.
+
+    Returns:
+    - int: El número de vuelos escritos.
+    """
+    if output_format not in ["csv", "parquet"]:
+        raise ValueError(f"El formato {output_format} no se puede escribir por trozos")
+
+    n_rows = 0
+    writer = None
+    reader = iter(pd.read_csv(file, usecols=flight_columns, chunksize=chunksize))
+
+    for i in itertools.count():
+        with timed("lectura"):
+            chunk = next(reader, None)
+        if chunk is None:
+            break
+
+        with timed("limpieza"):
+            chunk = clean_flights(chunk, airports)
+
+        with timed("escritura"):
+            if output_format == "csv":
+                # Solo el primer trozo crea el fichero y escribe la cabecera
+                chunk.to_csv(output, mode="w" if i == 0 else "a", header=i == 0, index=False)
+            else:
+                if writer is None:
+                    writer = pq.ParquetWriter(output, flight_schema)
+                table = pa.Table.from_pandas(compact_flights(chunk), schema=flight_schema, preserve_index=False)
+                writer.write_table(table)
+
+        n_rows += len(chunk)
+
+    if writer is not None:
+        writer.close()
+
+    return n_rows
+
+
+def remove_other_formats(name, output_format):
+    """
+    Borra las salidas de `name` que haya en los otros formatos y en la otra forma de guardarlas (un solo
+    fichero o una carpeta de particiones). La aplicación lee antes la carpeta que los ficheros y antes
+    parquet y feather que csv, asi que una salida antigua taparía a la nueva. Se llama después de escribir,
+    si la escritura falla se queda la salida anterior.
+
+    Parameters:
+    - name (str): Ruta del fichero (o de la carpeta de particiones) sin extensión.
+    - output_format (str): El formato que se ha escrito, o None si se ha escrito la carpeta de particiones.
+    """
+    for other in formats:
+        if other != output_format and os.path.exists(f"{name}.{other}"):
+            os.remove(f"{name}.{other}")
+
+    if output_format is not None and os.path.isdir(name):
+        shutil.rmtree(name)
+
+
+def save_df(df, name, output_format="csv"):
+    """
+    Guarda un DataFrame ya compactado en el formato indicado, borrando sus versiones en otros formatos.
+
+    Parameters:
+    - df (DataFrame): El DataFrame a guardar.
+    - name (str): Ruta del fichero sin extensión.
+    - output_format (str): "csv", "parquet" o "feather" (Arrow IPC).
+    """
+    if output_format == "csv":
+        df.to_csv(f"{name}.csv", index=False)
+
+    elif output_format == "parquet":
+        df.to_parquet(f"{name}.parquet", index=False)
+
+    elif output_format == "feather":
+        df.to_feather(f"{name}.feather")
+
+    else:
+        raise ValueError(f"Formato desconocido: {output_format}")
+
+    remove_other_formats(name, output_format)
+
+
+def save_dfs(df, df_continents, output_format="csv"):
+    """
+    Guarda los DataFrames de vuelos y de aeropuertos en el formato indicado.
+
+    Parameters:
+    - df (DataFrame): Un DataFrame de pandas con los vuelos ya limpios.
+    - df_continents (DataFrame): Un DataFrame de pandas con los aeropuertos ya limpios.
+    - output_format (str): "csv", "parquet" o "feather" (Arrow IPC).
+    """
+    save_df(compact_flights(df), "df", output_format)
+    save_df(compact_continents(df_continents), "df_continents", output_format)
+
+
+def clean_file(file, name, airports, chunksize=chunksize, output_format="csv"):
+    """
+    Limpia un fichero de vuelos y lo guarda, por trozos o de golpe según `chunksize`.
+
+    Parameters:
+    - file (str): Ruta al fichero de vuelos.
+    - name (str): Ruta del fichero de salida sin extensión.
+    - airports (Index): Los codigos ICAO de df_continents, en orden.
+    - chunksize (int): Filas por trozo, con 0 se lee todo el fichero de golpe.
+    - output_format (str): "csv", "parquet" o "feather" (este solo con chunksize 0).
+
+    Returns:
+    - int: El número de vuelos escritos.
+    """
+    if chunksize > 0:
+        n_rows = stream_flights(file, f"{name}.{output_format}", airports, chunksize, output_format)
+        remove_other_formats(name, output_format)
+        return n_rows
+
+    df = read_flights(file, airports)
+    with timed("escritura"):
+        save_df(compact_flights(df), name, output_format)
+    return len(df)
+
+
+def partition_name(file):
+    """
+    Obtiene el nombre de la partición (el mes, AAAAMM) a partir del nombre del fichero de vuelos.
+
+    Parameters:
+    - file (str): Ruta a un fichero como "flightlist_20200301_20200331.csv.gz".
+
+    Returns:
+    - str: El mes del fichero ("202003") o, si no sigue ese patrón, su nombre sin extensiones.
+    """
+    basename = os.path.basename(file)
+    match = re.match(r"flightlist_(\d{6})\d{2}_", basename)
+    if match:
+        return match.group(1)
+    return basename.split(".")[0]
+
+
+def check_partition_names(files):
+    """
+    Comprueba que cada fichero va a una partición distinta. Si dos ficheros tienen el mismo mes (por
+    ejemplo dos quincenas del mismo mes) uno sobreescribiría la partición del otro.
+
+    Parameters:
+    - files (list): Rutas de los ficheros de vuelos.
+    """
+    names = dict()
+    for file in files:
+        names.setdefault(partition_name(file), list()).append(file)
+
+    repeated = {name: paths for name, paths in names.items() if len(paths) > 1}
+    if repeated:
+        raise ValueError("Varios ficheros van a la misma partición: " +
+                         "; ".join(f"{name}: {', '.join(paths)}" for name, paths in sorted(repeated.items())))
+
+
+def file_hash(file):
+    """
+    Calcula el hash SHA-256 del contenido de un fichero, leyéndolo por bloques.
+
+    Parameters:
+    - file (str): Ruta del fichero.
+
+    Returns:
+    - str: El hash en hexadecimal.
+    """
+    sha = hashlib.sha256()
+    with open(file, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def load_manifest(output_dir):
+    """
+    Lee el manifiesto de ficheros ya limpiados de la carpeta de particiones.
+
+    Parameters:
+    - output_dir (str): Carpeta de las particiones.
+
+    Returns:
+    - dict: Para cada fichero de entrada (ruta absoluta) su tamaño, fecha de modificación, hash,
+      formato, particiones generadas y número de vuelos. Vacío si todavía no hay manifiesto.
+    """
+    path = os.path.join(output_dir, manifest_file)
+    if not os.path.exists(path):
+        return dict()
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, output_dir):
+    """
+    Guarda el manifiesto en la carpeta de particiones, con `atomic_write` para no dejar nunca un
+    manifiesto a medias.
+
+    Parameters:
+    - manifest (dict): El manifiesto a guardar.
+    - output_dir (str): Carpeta de las particiones.
+    """
+    with atomic_write(os.path.join(output_dir, manifest_file)) as tmp:
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=2)
+
+
+def remove_outputs(entry):
+    """
+    Borra las particiones que generó un fichero según su entrada del manifiesto.
+
+    Parameters:
+    - entry (dict): La entrada del manifiesto.
+    """
+    for output in entry["outputs"]:
+        if os.path.exists(output):
+            os.remove(output)
+
+
+def prune_manifest(manifest, prune=False):
+    """
+    Busca en el manifiesto los ficheros de entrada que ya no existen. Es normal archivar o mover los
+    ficheros originales después de limpiarlos, asi que por defecto sus particiones se siguen usando y
+    solo se avisa; con `prune` se quitan del manifiesto y se borran sus particiones.
+
+    Parameters:
+    - manifest (dict): El manifiesto actual, se modifica en el sitio si `prune` es True.
+    - prune (bool): Si es True se borran las entradas y las particiones de los ficheros que no existen.
+
+    Returns:
+    - list: Los ficheros de entrada que no existen.
+    """
+    missing = [file for file in manifest if not os.path.exists(file)]
+
+    for file in missing:
+        if prune:
+            remove_outputs(manifest.pop(file))
+        else:
+            print(f"Aviso: no existe {file}, se mantienen sus particiones (usa --prune para borrarlas)")
+
+    return missing
+
+
+def pending_files(files, manifest, output_format, reference):
+    """
+    Selecciona los ficheros que hay que limpiar: los nuevos, los modificados y aquellos cuyas
+    particiones ya no existen, están en otro formato o usan otros ids de aeropuertos. Si un fichero
+    solo ha cambiado de fecha pero su contenido es el mismo, se actualiza la fecha en el manifiesto
+    y no se limpia.
+
+    Parameters:
+    - files (list): Rutas de los ficheros de vuelos.
+    - manifest (dict): El manifiesto actual, se modifica en el sitio.
+    - output_format (str): Formato de las particiones.
+    - reference (str): Hash de los codigos ICAO con los que se asignan los ids (ver `airports_hash`).
+
+    Returns:
+    - list: Las rutas de los ficheros que hay que limpiar.
+    """
+    pending = list()
+
+    for file in files:
+        entry = manifest.get(os.path.abspath(file))
+        stat = os.stat(file)
+
+        if (entry is None or entry["format"] != output_format or entry.get("reference") != reference
+                or not all(os.path.exists(output) for output in entry["outputs"])):
+            pending.append(file)
+
+        elif entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime:
+            # Solo se calcula el hash cuando el tamaño o la fecha no coinciden
+            if entry["size"] == stat.st_size and entry["sha256"] == file_hash(file):
+                entry["mtime"] = stat.st_mtime
+            else:
+                pending.append(file)
+
+    return pending
+
+
+def clean_partition(file, output_dir, airports, chunksize=chunksize, output_format="csv"):
+    """
+    Limpia un fichero mensual y lo guarda como una partición dentro de `output_dir`.
+    Se ejecuta en los procesos del pool, por eso devuelve sus propios tiempos.
+
+    Parameters:
+    - file (str): Ruta al fichero de vuelos.
+    - output_dir (str): Carpeta donde se guardan las particiones.
+    - airports (Index): Los codigos ICAO de df_continents, en orden.
+    - chunksize (int): Filas por trozo, con 0 se lee todo el fichero de golpe.
+    - output_format (str): Formato de la partición.
+
+    Returns:
+    - tuple: La entrada del manifiesto para este fichero y los tiempos de cada etapa.
+    """
+    timings.clear()
+    stat = os.stat(file)
+    name = os.path.join(output_dir, partition_name(file))
+    n_rows = clean_file(file, name, airports, chunksize, output_format)
+
+    entry = {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "sha256": file_hash(file),
+        "format": output_format,
+        "reference": airports_hash(airports),
+        "outputs": [f"{name}.{output_format}"],
+        "rows": n_rows,
+    }
+    return entry, dict(timings)
+
+
+def clean_partitions(files, output_dir, airports, chunksize=chunksize, output_format="csv", workers=None):
+    """
+    Limpia varios ficheros mensuales en paralelo, uno por proceso, escribiendo una partición por mes.
+    Todos los procesos reciben los mismos codigos ICAO, asi que los ids son iguales en todas las particiones.
+
+    Parameters:
+    - files (list): Rutas de los ficheros de vuelos.
+    - output_dir (str): Carpeta donde se guardan las particiones.
+    - airports (Index): Los codigos ICAO de df_continents, en orden.
+    - chunksize (int): Filas por trozo, con 0 se lee cada fichero de golpe.
+    - output_format (str): Formato de las particiones.
+    - workers (int): Número de procesos, por defecto uno por núcleo.
+
+    Returns:
+    - dict: La entrada del manifiesto de cada fichero, con su ruta absoluta como clave.
+    """
+    check_partition_names(files)
+    os.makedirs(output_dir, exist_ok=True)
+    entries = dict()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {f: pool.submit(clean_partition, f, output_dir, airports, chunksize, output_format) for f in files}
+
+        for f, future in futures.items():
+            entry, file_timings = future.result()
+            entries[os.path.abspath(f)] = entry
+            for step, seconds in file_timings.items():
+                timings[step] = timings.get(step, 0) + seconds
+
+    return entries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Limpia el dataset de vuelos y el de aeropuertos")
+    parser.add_argument("--file", default=file, help="Fichero de vuelos a limpiar")
+    parser.add_argument("--files", help="Patrón (glob) de ficheros mensuales a limpiar en paralelo, "
+                                        "cada uno se guarda como una partición en la carpeta df/")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos para --files, por defecto uno por núcleo")
+    parser.add_argument("--reference-dir", default=reference_dir,
+                        help="Carpeta con las copias locales de los datasets de aeropuertos y paises")
+    parser.add_argument("--refresh-reference", action="store_true",
+                        help="Vuelve a descargar los datasets de aeropuertos y paises")
+    parser.add_argument("--offline", action="store_true",
+                        help="No descarga nada, usa solo las copias locales de --reference-dir")
+    parser.add_argument("--full", action="store_true",
+                        help="Con --files, vuelve a limpiar todos los ficheros aunque ya estén en el manifiesto")
+    parser.add_argument("--prune", action="store_true",
+                        help="Con --files, borra las particiones de los ficheros del manifiesto que ya no existen")
+    parser.add_argument("--chunksize", type=int, default=chunksize,
+                        help="Filas por trozo en el modo streaming, con 0 se lee todo el fichero de golpe")
+    parser.add_argument("--format", choices=formats, default="csv", help="Formato de los ficheros de salida")
+    args = parser.parse_args()
+
+    if args.chunksize > 0 and args.format == "feather":
+        parser.error("el formato feather no admite el modo streaming, usa --chunksize 0 o --format parquet")
+
+    if args.offline and args.refresh_reference:
+        parser.error("--refresh-reference necesita conexion, no se puede usar con --offline")
+
+    start = time.perf_counter()
+
+    # La tabla de aeropuertos se construye una sola vez, antes de repartir los ficheros,
+    # para que todas las particiones se correspondan con la misma referencia
+    with timed("aeropuertos"):
+        df_continents = load_continents(args.reference_dir, args.refresh_reference, args.offline)
+        airports = pd.Index(df_continents["icao_code"])
+
+    if args.files:
+        files = sorted(glob.glob(args.files))
+        if not files:
+            parser.error(f"no hay ficheros que cumplan el patrón {args.files}")
+
+        # Solo se limpian los ficheros nuevos o modificados desde la última ejecución
+        manifest = load_manifest("df")
+        prune_manifest(manifest, args.prune)
+        # Antes de borrar nada, tambien contra los ficheros ya limpiados que no entran en el patrón
+        check_partition_names(sorted({os.path.abspath(file) for file in files} | set(manifest)))
+        if not args.full:
+            files = pending_files(files, manifest, args.format, airports_hash(airports))
+        print(f"{len(files)} ficheros nuevos o modificados")
 
-# Da distintos valores de latitud y longitud para los mismos aeropuertos, quitare todas estas posiciones
-# y usare las posiciones que hay en df_continentes
+        # Las particiones anteriores de estos ficheros se borran antes de volver a limpiarlos, si
+        # cambia el formato no quedan las dos versiones del mismo mes
+        for file in files:
+            entry = manifest.pop(os.path.abspath(file), None)
+            if entry is not None:
+                remove_outputs(entry)
+        os.makedirs("df", exist_ok=True)
+        # Se guarda ya sin esas entradas, si la limpieza falla el manifiesto no apunta a particiones borradas
+        save_manifest(manifest, "df")
 
-# Además eliminare los elemntos que no sean necesarios
+        entries = clean_partitions(files, "df", airports, args.chunksize, args.format, args.workers)
+        manifest.update(entries)
+        save_manifest(manifest, "df")
+        # Si antes se limpió un solo fichero, su df.<formato> ya no vale
+        remove_other_formats("df", None)
+        n_rows = sum(entry["rows"] for entry in entries.values())
+    else:
+        n_rows = clean_file(args.file, "df", airports, args.chunksize, args.format)
 
-df.drop(["callsign", "number", "icao24", "registration", "typecode", "firstseen", "lastseen",
-         "latitude_1", "longitude_1", "altitude_1", "latitude_2", "longitude_2", "altitude_2"], axis=1, inplace=True)
+    # La tabla de aeropuertos es pequeña, se guarda de golpe
+    with timed("escritura"):
+        save_df(compact_continents(df_continents), "df_continents", args.format)
 
-def save_dfs(df, df_continents):
-    df.to_csv("df.csv", index=False)
-    df_continents.to_csv("df_continents.csv", index=False)
-       
-save_dfs(df, df_continents)
\ No newline at end of file
+    report_timings(n_rows, time.perf_counter() - start)
@@ -0,0 +1,1634 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+
+# Columnas de los vuelos que usa la aplicación y sus tipos al leerlos desde CSV.
+# Los aeropuertos vienen como ids: la posición del aeropuerto en df_continents, o -1 si no está.
+# El día es la fecha del vuelo como número de días desde el 1970-01-01 y la hora es la hora en la que se
+# vio por primera vez (firstseen) contada desde el principio de ese día, asi que day * 24 + hour es el
+# momento del vuelo en horas desde el 1970-01-01 con un solo byte más por vuelo
+flight_dtypes = {"origin": "int32", "destination": "int32", "day": "int32", "hour": "int8"}
+# Primer y último día posibles, para los rangos de fechas abiertos
+min_day, max_day = int(np.iinfo(np.int32).min), int(np.iinfo(np.int32).max)
+# Rango de días (primero, último) que deja cada comparación del filtro de día
+day_ranges = {"=": lambda day: (day, day), "<": lambda day: (min_day, day - 1), ">": lambda day: (day + 1, max_day)}
+# Resoluciones de las series temporales y cuántas horas dura cada intervalo
+periods = {"hour": 1, "day": 24, "week": 24 * 7}
+# El 1970-01-01 fue jueves, las semanas se desplazan 3 días para que empiecen en lunes
+week_offset = 3 * 24
+# Columna de df_continents que usa cada filtro de aeropuertos
+filter_columns = {"Pais": "country_name", "Continente": "continent"}
+# Formas de contar los vuelos de cada país: por su origen, por su destino o por los dos
+country_modes = ["origin", "destination", "both"]
+
+continent_dtypes = {"type": "category", "continent": "category", "iso_country": "category", "country_name": "category"}
+
+# Carpeta donde se guardan las columnas de los vuelos como arrays de numpy, para abrirlas con mmap
+# y que todas las sesiones compartan la misma memoria
+store_dir = "df_store"
+# Forma en la que se guardan las filas en el almacen. Entra en la version de los datos, asi que al
+# cambiarla se reconstruyen los almacenes antiguos
+store_layout = "sorted-by-day+hour"
+# Carpeta donde el CLI guarda los agregados sin filtros, una subcarpeta por version de los datos
+aggregates_dir = "aggregates"
+# Carpeta donde se dejan los vuelos nuevos (ya limpios, con las columnas de `flight_dtypes`) para añadirlos
+# sin volver a cargar todo. Cada fichero se lee una sola vez, asi que se tiene que escribir con otro nombre
+# (por ejemplo terminado en .tmp) y renombrar cuando esté completo
+incoming_dir = os.environ.get("APP_INCOMING_DIR", "incoming")
+batch_extensions = (".parquet", ".feather", ".csv")
+# Fichero, dentro de la carpeta de particiones, donde la limpieza apunta los ficheros ya limpiados y
+# las particiones que ha generado cada uno
+manifest_file = "manifest.json"
+
+# Fichero donde se añaden las etapas medidas por la instrumentación (una línea JSON por ejecución)
+profile_log = os.environ.get("APP_PROFILE_LOG", "profile_log.jsonl")
+# Las etapas de la ejecución en curso. Es local a cada hilo, asi no se mezclan las sesiones ni la precarga
+profiling = threading.local()
+
+# ---------------------------------------------------------------------------
+# Instrumentación
+
+def start_profiling(memory=False):
+    """
+    Empieza a medir las etapas de la ejecución actual del script.
+
+    Parameters:
+    - memory (bool): Si es True tambien se mide la memoria. tracemalloc se activa para todo el proceso y
+      ya no se para (lo usan todas las ejecuciones medidas), asi que solo se debe pedir cuando se quiere
+      medir el proceso entero y no en una ejecución suelta.
+    """
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    profiling.memory = memory
+    profiling.stages = list()
+    profiling.depth = 0
+
+
+def finish_profiling(extra):
+    """
+    Termina de medir las etapas de la ejecución actual y las añade al fichero `profile_log`.
+
+    Parameters:
+    - extra (dict): Datos de la ejecución que se guardan junto a las etapas (por ejemplo los filtros).
+
+    Returns:
+    - list: Las etapas medidas, un diccionario por etapa.
+    """
+    stages = profiling.stages
+    profiling.stages = None
+
+    with open(profile_log, "a") as f:
+        f.write(json.dumps({"time": datetime.now().isoformat(), **extra, "stages": stages}) + "\n")
+    return stages
+
+
+@contextmanager
+def stage(name):
+    """
+    Mide el tiempo de un bloque, y la variación de memoria (con tracemalloc) si se ha pedido, si la
+    instrumentación está activa en este hilo. Las etapas se pueden anidar. Sin instrumentación no hace nada.
+
+    Parameters:
+    - name (str): Nombre de la etapa.
+    """
+    stages = getattr(profiling, "stages", None)
+    if stages is None:
+        yield
+        return
+
+    record = {"stage": name, "depth": profiling.depth}
+    stages.append(record)
+    profiling.depth += 1
+    memory = tracemalloc.get_traced_memory()[0] if profiling.memory else None
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record["seconds"] = round(time.perf_counter() - start, 6)
+        if memory is not None:
+            record["memory_mb"] = round((tracemalloc.get_traced_memory()[0] - memory) / 2**20, 3)
+        profiling.depth -= 1
+
+
+# ---------------------------------------------------------------------------
+# Escritura de ficheros
+
+@contextmanager
+def atomic_write(path, directory=False, overwrite=True):
+    """
+    Escribe un fichero (o una carpeta) sin que nadie lo pueda encontrar nunca a medias: se escribe en una
+    ruta temporal, única para cada proceso e hilo, que al terminar se renombra a `path`. Si la escritura
+    falla se borra la ruta temporal.
+
+    Parameters:
+    - path (str): Ruta de destino.
+    - directory (bool): Si lo que se escribe es una carpeta. La carpeta temporal ya viene creada.
+    - overwrite (bool): Si `path` ya existe, se sustituye. Con False se deja el que hay y se descarta
+      el nuevo (por ejemplo si otro proceso ha escrito la misma version a la vez).
+
+    Yields:
+    - str: La ruta temporal en la que hay que escribir.
+    """
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    if directory:
+        os.makedirs(tmp)
+
+    try:
+        yield tmp
+        if directory and overwrite and os.path.isdir(path):
+            # Una carpeta no se puede sustituir con os.replace, primero se aparta la antigua
+            old = f"{tmp}.old"
+            os.replace(path, old)
+            shutil.rmtree(old, ignore_errors=True)
+        try:
+            os.replace(tmp, path)
+        except OSError:
+            if overwrite or not os.path.exists(path):
+                raise
+    finally:
+        if os.path.isdir(tmp):
+            shutil.rmtree(tmp, ignore_errors=True)
+        elif os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def remove_old_versions(directory, keep):
+    """
+    Borra las carpetas de versiones antiguas de `directory` (del almacen o de los agregados). Las carpetas
+    temporales de `atomic_write` no se tocan, pueden ser de otro proceso que está escribiendo.
+
+    Parameters:
+    - directory (str): La carpeta con una subcarpeta por version.
+    - keep (str): La version que se queda.
+    """
+    if not os.path.isdir(directory):
+        return
+
+    for old in os.listdir(directory):
+        if old != keep and not old.endswith(".tmp") and os.path.isdir(os.path.join(directory, old)):
+            shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+
+
+# ---------------------------------------------------------------------------
+# Carga de datos
+
+def find_data_file(name):
+    """
+    Busca el fichero de datos con el nombre dado, dando preferencia a las carpetas de particiones
+    y a los formatos columnares.
+
+    Parameters:
+    - name (str): Nombre del fichero sin extensión ("df" o "df_continents").
+
+    Returns:
+    - str: La carpeta `name` si existe o la ruta del primer fichero que existe entre .parquet, .feather y .csv.
+    """
+    if os.path.isdir(name):
+        return name
+
+    for extension in ["parquet", "feather"]:
+        path = f"{name}.{extension}"
+        if os.path.exists(path):
+            return path
+    return f"{name}.csv"
+
+
+def read_data_file(name, dtypes):
+    """
+    Lee un fichero de datos (o todas las particiones de su carpeta) leyendo solo las columnas
+    de `dtypes` y con esos tipos.
+
+    Parameters:
+    - name (str): Nombre del fichero sin extensión.
+    - dtypes (dict): Columnas a leer y su tipo. Con None se leen todas las columnas.
+
+    Returns:
+    - DataFrame: El DataFrame leído.
+    """
+    path = find_data_file(name)
+
+    if os.path.isdir(path):
+        parts = [read_table(file, dtypes) for file in partition_files(path)]
+        # Cada partición trae sus propias categorias, al unirlas hay que volver a convertirlas
+        df = pd.concat(parts, ignore_index=True)
+        return df.astype(dtypes) if dtypes is not None else df
+
+    return read_table(path, dtypes)
+
+
+def partition_files(path):
+    """
+    Lista las particiones de una carpeta de datos. Si hay manifiesto de la limpieza solo se usan las
+    particiones que apunta, asi no se leen dos veces los meses que quedaron en otro formato de una
+    limpieza anterior.
+
+    Parameters:
+    - path (str): Carpeta de las particiones.
+
+    Returns:
+    - list: Las rutas de las particiones, ordenadas.
+    """
+    manifest = os.path.join(path, manifest_file)
+    if os.path.exists(manifest):
+        with open(manifest) as f:
+            entries = json.load(f)
+        # Las salidas se apuntan con la ruta desde donde se ejecutó la limpieza, solo vale el nombre
+        files = {os.path.basename(output) for entry in entries.values() for output in entry["outputs"]}
+    else:
+        files = {file for file in os.listdir(path) if file.endswith(batch_extensions)}
+
+    return [os.path.join(path, file) for file in sorted(files)]
+
+
+def read_table(path, dtypes):
+    """
+    Lee un único fichero parquet, feather o CSV.
+
+    Parameters:
+    - path (str): Ruta del fichero.
+    - dtypes (dict): Columnas a leer y su tipo. Con None se leen todas las columnas.
+
+    Returns:
+    - DataFrame: El DataFrame leído.
+    """
+    columns = list(dtypes) if dtypes is not None else None
+
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path, columns=columns)
+
+    elif path.endswith(".feather"):
+        return pd.read_feather(path, columns=columns)
+
+    return pd.read_csv(path, usecols=columns, dtype=dtypes)
+
+
+def data_version():
+    """
+    Calcula una version de los datos a partir de su contenido. Las particiones limpiadas con manifiesto
+    usan el hash del fichero de origen que apunta la limpieza, y el resto de ficheros se leen enteros
+    para calcular su hash, asi que copiar o tocar los ficheros sin cambiarlos no cambia la version.
+
+    Returns:
+    - str: Un hash que cambia cuando cambia algun fichero de datos (o la forma del almacen).
+    """
+    sha = hashlib.sha256(store_layout.encode())
+    for name in ["df", "df_continents"]:
+        path = find_data_file(name)
+        manifest = os.path.join(path, manifest_file)
+        if os.path.isdir(path) and os.path.exists(manifest):
+            with open(manifest) as f:
+                entries = json.load(f)
+            # Cada partición depende del fichero de origen, del formato y de los ids de los aeropuertos
+            for entry in sorted(entries.values(), key=lambda entry: entry["outputs"]):
+                outputs = ",".join(os.path.basename(output) for output in entry["outputs"])
+                sha.update(f"{outputs}:{entry['sha256']}:{entry['format']}:{entry.get('reference')}".encode())
+            continue
+
+        for file in partition_files(path) if os.path.isdir(path) else [path]:
+            sha.update(os.path.basename(file).encode())
+            with open(file, "rb") as f:
+                for block in iter(lambda: f.read(2**20), b""):
+                    sha.update(block)
+    return sha.hexdigest()
+
+
+def save_column_store(frames, path):
+    """
+    Guarda cada columna de cada DataFrame como un fichero .npy dentro de la carpeta `path`, con
+    `atomic_write`. Si otro proceso ha escrito la misma version a la vez, nos quedamos con la suya.
+
+    Parameters:
+    - frames (dict): DataFrames a guardar, con su nombre como clave.
+    - path (str): Carpeta de destino.
+    """
+    with atomic_write(path, directory=True, overwrite=False) as tmp:
+        columns = dict()
+        for name, frame in frames.items():
+            columns[name] = list(frame.columns)
+            for column in frame.columns:
+                np.save(os.path.join(tmp, f"{name}.{column}.npy"), frame[column].to_numpy())
+
+        with open(os.path.join(tmp, "columns.json"), "w") as f:
+            json.dump(columns, f)
+
+
+def load_column_store(path):
+    """
+    Abre con mmap, en modo solo lectura, los DataFrames guardados con `save_column_store`.
+    Los datos no se copian: todas las sesiones (y procesos) leen de las mismas paginas de memoria.
+
+    Parameters:
+    - path (str): Carpeta del almacen.
+
+    Returns:
+    - dict: Los DataFrames, con su nombre como clave.
+    """
+    with open(os.path.join(path, "columns.json")) as f:
+        columns = json.load(f)
+
+    frames = dict()
+    for name, frame_columns in columns.items():
+        arrays = {column: np.load(os.path.join(path, f"{name}.{column}.npy"), mmap_mode="r")
+                  for column in frame_columns}
+        frames[name] = pd.DataFrame(arrays, copy=False)
+    return frames
+
+
+def read_continents():
+    """
+    Lee la tabla de aeropuertos. Se muestra entera, asi que se leen todas sus columnas.
+
+    Returns:
+    - DataFrame: Los aeropuertos, indexados por su id (el mismo que usan los vuelos).
+    """
+    df_continents = read_data_file("df_continents", None)
+    df_continents = df_continents.astype(continent_dtypes)
+    df_continents.index.name = "airport_id"
+    return df_continents
+
+
+def build_store(df_continents, version):
+    """
+    Construye, si no existe ya, el almacen de columnas de una version de los datos: los vuelos y
+    la tabla agregada de vuelos sobre la que trabajan los filtros y las gráficas, las dos ordenadas
+    por fecha para que los filtros de fechas sean una busqueda binaria.
+
+    Parameters:
+    - df_continents (DataFrame): Los aeropuertos de `read_continents`.
+    - version (str): La version de los datos, de `data_version`.
+
+    Returns:
+    - str: La carpeta del almacen.
+    """
+    path = os.path.join(store_dir, version)
+    if not os.path.isdir(path):
+        df = read_data_file("df", flight_dtypes).sort_values("day", kind="stable", ignore_index=True)
+        df_cube = add_flight_continents(build_flight_cube(df), df_continents)
+        save_column_store({"df": df, "df_cube": df_cube}, path)
+        # Las versiones anteriores ya no se van a usar
+        remove_old_versions(store_dir, version)
+
+    return path
+
+
+def read_data():
+    """
+    Carga los datos públicos. Si existen en parquet o feather se leen de ahí, que ya vienen tipados,
+    y si no desde CSV.
+
+    Los vuelos se guardan la primera vez (o al precalcular con `python flights_engine.py`) en un almacen de
+    columnas que se abre con mmap, asi que cada llamada devuelve DataFrames de solo lectura que comparten
+    la misma memoria.
+
+    Returns:
+    -------
+    - df con los datos, df_continents con los aeropuertos, df_cube con los vuelos agregados y
+      la version de los datos
+    """
+    version = data_version()
+    df_continents = read_continents()
+    frames = load_column_store(build_store(df_continents, version))
+    return frames["df"], df_continents, frames["df_cube"], version
+
+
+def build_flight_cube(df):
+    """
+    Agrega los vuelos por (día, aeropuerto de origen, aeropuerto de destino). Cada fila del resultado
+    es una ruta en un día con el número de vuelos que la han hecho, asi que los filtros y las gráficas
+    dependen del número de rutas y no del número de vuelos.
+
+    Parameters:
+    - df (DataFrame): Un DataFrame de vuelos con las columnas "day", "origin" y "destination".
+
+    Returns:
+    - DataFrame: Un DataFrame con las columnas "day", "origin", "destination" y "num_flights", ordenado por "day".
+    """
+    df_cube = df.groupby(["day", "origin", "destination"], sort=False).size().reset_index(name="num_flights")
+    df_cube["num_flights"] = df_cube["num_flights"].astype("int32")
+    return df_cube.sort_values("day", kind="stable", ignore_index=True)
+
+
+def add_flight_continents(df, df_continents):
+    """
+    Añade a cada vuelo el continente de su aeropuerto de origen y de destino, como codigo de la
+    categoria "continent" de df_continents (-1 si el aeropuerto es desconocido).
+
+    Parameters:
+    - df (DataFrame): Un DataFrame de vuelos con las columnas "origin" y "destination" como ids.
+    - df_continents (DataFrame): Un DataFrame de aeropuertos indexado por id, sin filtrar.
+
+    Returns:
+    - DataFrame: El DataFrame con las columnas "origin_continent" y "destination_continent" (int8).
+    """
+    # Se añade un -1 al final para que los aeropuertos desconocidos (id -1) caigan ahi
+    continent_codes = np.append(df_continents["continent"].cat.codes.to_numpy(), -1).astype("int8")
+    df["origin_continent"] = continent_codes[df["origin"].to_numpy()]
+    df["destination_continent"] = continent_codes[df["destination"].to_numpy()]
+    return df
+
+
+# ---------------------------------------------------------------------------
+# Fechas
+
+def date_to_day(date):
+    """
+    Convierte una fecha en el número de día que se guarda en la columna "day".
+
+    Parameters:
+    - date (date o str): La fecha.
+
+    Returns:
+    - int: El número de días desde el 1970-01-01.
+    """
+    return int(np.datetime64(date, "D").astype(np.int64))
+
+
+def days_to_dates(days):
+    """
+    Convierte números de día en fechas, para mostrarlas.
+
+    Parameters:
+    - days (ndarray, Series o int): Números de días desde el 1970-01-01.
+
+    Returns:
+    - ndarray o datetime64: Las fechas (datetime64[D]).
+    """
+    return np.asarray(days).astype("datetime64[D]")
+
+
+def decode_days(df):
+    """
+    Cambia la columna "day" de un DataFrame de vuelos por la fecha, para mostrarlo.
+
+    Parameters:
+    - df (DataFrame): Un DataFrame de vuelos, puede no tener la columna "day".
+
+    Returns:
+    - DataFrame: Una copia de `df` con las fechas.
+    """
+    if "day" not in df:
+        return df
+    return df.assign(day=days_to_dates(df["day"].to_numpy()))
+
+
+def day_index(df):
+    """
+    Construye el indice de fechas de un DataFrame ordenado por "day": cada fecha que aparece y la
+    fila donde empieza. Con él, las filas de un rango de fechas se encuentran con una busqueda binaria.
+
+    Parameters:
+    - df (DataFrame): Un DataFrame de vuelos ordenado por "day".
+
+    Returns:
+    - tuple: Las fechas distintas (ndarray) y las posiciones donde empieza cada una, con una posición
+      más al final (el número de filas).
+    """
+    day = df["day"].to_numpy()
+    starts = np.flatnonzero(day[1:] != day[:-1]) + 1
+    offsets = np.concatenate([[0], starts, [len(day)]]).astype(np.int64)
+    return day[offsets[:-1]], offsets
+
+
+def day_rows(df, first, last, index=None):
+    """
+    Busca las filas de un rango de fechas en un DataFrame ordenado por "day", con una busqueda binaria.
+
+    Parameters:
+    - df (DataFrame): Un DataFrame de vuelos ordenado por "day".
+    - first (int): Primer día del rango.
+    - last (int): Último día del rango (incluido).
+    - index (tuple): El indice de `day_index` de `df`. Sin él se busca directamente en la columna.
+
+    Returns:
+    - slice: Las filas del rango, para usarlo con `df.iloc` sin copiar los datos.
+    """
+    if index is not None:
+        days, offsets = index
+        return slice(int(offsets[np.searchsorted(days, first, "left")]),
+                     int(offsets[np.searchsorted(days, last, "right")]))
+
+    day = df["day"].to_numpy()
+    return slice(int(np.searchsorted(day, first, "left")), int(np.searchsorted(day, last, "right")))
+
+
+def flight_hours(df):
+    """
+    Calcula el momento de cada vuelo en horas desde el 1970-01-01.
+
+    Parameters:
+    - df (DataFrame): Un DataFrame de vuelos con la columna "day" y, si la tiene, "hour". Sin "hour"
+      (por ejemplo la tabla agregada) cada vuelo cuenta al principio de su día.
+
+    Returns:
+    - ndarray: Las horas de cada fila (int64).
+    """
+    hours = df["day"].to_numpy().astype(np.int64) * 24
+    if "hour" in df:
+        hours += df["hour"].to_numpy()
+    return hours
+
+
+def time_buckets(df, period):
+    """
+    Asigna cada vuelo al intervalo de la resolución elegida, de forma vectorizada.
+
+    Parameters:
+    - df (DataFrame): Un DataFrame de vuelos. Para la resolución "hour" tiene que tener la columna "hour".
+    - period (str): Una resolución de `periods`: "hour", "day" o "week" (las semanas empiezan en lunes).
+
+    Returns:
+    - ndarray: El principio de cada intervalo en horas desde el 1970-01-01 (int64).
+    """
+    if period == "hour":
+        if "hour" not in df:
+            raise ValueError("La resolución por horas necesita la columna 'hour', la tabla agregada no la tiene")
+        return flight_hours(df)
+
+    # Los días y las semanas solo usan "day": un vuelo visto el día anterior tiene la hora negativa y caería
+    # en otro intervalo que en la tabla agregada, que no tiene la hora
+    width = periods[period]
+    offset = week_offset if period == "week" else 0
+    return (df["day"].to_numpy().astype(np.int64) * 24 + offset) // width * width - offset
+
+
+def hours_to_milliseconds(hours):
+    """
+    Convierte horas desde el 1970-01-01 en milisegundos desde el 1970-01-01, que es como Plotly
+    guarda las fechas. En un eje de tipo "date" se muestran como fechas, pero viajan al navegador como
+    un array binario de números y no como una cadena de texto por punto.
+
+    Parameters:
+    - hours (ndarray, Series o int): Horas desde el 1970-01-01.
+
+    Returns:
+    - ndarray o float: Los milisegundos. Son float64 porque Plotly solo manda como binario los enteros que
+      caben en 32 bits, y un float64 guarda exactos los milisegundos de cualquier fecha.
+    """
+    return np.asarray(hours, dtype=np.float64) * 3_600_000
+
+
+# ---------------------------------------------------------------------------
+# Aeropuertos
+
+def airport_table(airport_ids):
+    """
+    Construye una tabla de booleanos indexada por id que vale True en los aeropuertos seleccionados.
+    La ultima posicion siempre es False.
+
+    Parameters:
+    - airport_ids (Index o ndarray): Ids de los aeropuertos seleccionados.
+
+    Returns:
+    - ndarray: La tabla de booleanos, con un elemento más que el mayor id seleccionado.
+    """
+    n_airports = int(airport_ids.max()) + 1 if len(airport_ids) else 0
+    table = np.zeros(n_airports + 1, dtype=bool)
+    table[airport_ids] = True
+    return table
+
+
+def in_airport_table(ids, table):
+    """
+    Indica para cada id de aeropuerto si está marcado en la tabla de `airport_table`.
+
+    Parameters:
+    - ids (Series o ndarray): Ids de aeropuertos a comprobar (por ejemplo la columna "origin").
+    - table (ndarray): La tabla de booleanos.
+
+    Returns:
+    - ndarray: Un array de booleanos del mismo tamaño que `ids`.
+    """
+    # Los ids que no estan en la tabla y los desconocidos (-1) caen en la ultima posicion, que es False
+    return table[np.minimum(ids, len(table) - 1)]
+
+
+def airport_lookup(ids, airport_ids):
+    """
+    Indica para cada id de aeropuerto si está entre los ids seleccionados, usando una tabla de
+    booleanos indexada por id en lugar de buscar cada valor.
+
+    Parameters:
+    - ids (Series o ndarray): Ids de aeropuertos a comprobar (por ejemplo la columna "origin").
+    - airport_ids (Index o ndarray): Ids de los aeropuertos seleccionados.
+
+    Returns:
+    - ndarray: Un array de booleanos del mismo tamaño que `ids`.
+    """
+    return in_airport_table(ids, airport_table(airport_ids))
+
+
+def decode_airports(df, df_continents):
+    """
+    Cambia los ids de aeropuerto de un DataFrame de vuelos por su codigo ICAO, para mostrarlo.
+
+    Parameters:
+    - df (DataFrame): Un DataFrame de pandas con las columnas "origin" y "destination" como ids.
+    - df_continents (DataFrame): Un DataFrame con la columna "icao_code" e indexado por id (sin filtrar).
+
+    Returns:
+    - DataFrame: Una copia de `df` con los codigos ICAO. Los aeropuertos desconocidos quedan vacios.
+    """
+    # Se añade un valor vacio al final para que el id -1 caiga ahi
+    icao = np.append(df_continents["icao_code"].to_numpy(dtype=object), None)
+    # Al mostrar la tabla por páginas se pueden haber quitado algunas columnas
+    return df.assign(**{column: icao[df[column]] for column in ["origin", "destination"] if column in df})
+
+
+# ---------------------------------------------------------------------------
+# Agregaciones
+
+def count_flights_by(df, column):
+    """
+    Cuenta el número de vuelos por cada valor de una columna. Sirve tanto para la tabla de vuelos
+    (un vuelo por fila) como para la tabla agregada (con la columna "num_flights").
+
+    Parameters:
+    - df (DataFrame): Un DataFrame de vuelos o de vuelos agregados.
+    - column (str): La columna por la que se cuenta.
+
+    Returns:
+    - Series: El número de vuelos por cada valor de `column`, ordenado por ese valor.
+    """
+    if "num_flights" in df:
+        return df.groupby(column)["num_flights"].sum()
+    return df[column].value_counts().sort_index()
+
+
+def flight_weights(df):
+    """
+    Devuelve cuántos vuelos representa cada fila del DataFrame.
+
+    Parameters:
+    - df (DataFrame): Un DataFrame de vuelos o de vuelos agregados.
+
+    Returns:
+    - ndarray o None: La columna "num_flights" en la tabla agregada, o None si cada fila es un vuelo.
+    """
+    return df["num_flights"].to_numpy() if "num_flights" in df else None
+
+
+def count_flights_per_period(df, period="day"):
+    """
+    Cuenta el número de vuelos de cada intervalo de tiempo (hora, día o semana) con una sola pasada.
+
+    Parameters:
+    - df (DataFrame): Un DataFrame de vuelos (o de vuelos agregados, salvo para la resolución "hour").
+    - period (str): Una resolución de `periods`.
+
+    Returns:
+    - DataFrame: Un DataFrame indexado por intervalo con dos columnas: "num_flights" (número de vuelos)
+      y "time" (principio del intervalo en horas desde el 1970-01-01). Solo salen los intervalos con vuelos.
+    """
+    codes, times = pd.factorize(time_buckets(df, period), sort=True)
+    counts = np.bincount(codes, weights=flight_weights(df), minlength=len(times)).astype(np.int64)
+
+    return pd.DataFrame({"num_flights": counts, "time": times}, index=pd.Index(times, name="time"))
+
+
+def count_flights_per_period_by_continent(df, continents, period="day"):
+    """
+    Cuenta el número de vuelos de cada intervalo de tiempo que tienen origen o destino en cada continente,
+    todos los continentes a la vez. Un vuelo cuenta una vez en el continente de origen y otra en el de destino
+    solo si es distinto, asi que los vuelos dentro de un mismo continente no se cuentan dos veces.
+
+    Parameters:
+    - df (DataFrame): Un DataFrame de vuelos (o de vuelos agregados) con las columnas "day", "origin_continent"
+      y "destination_continent", y "hour" para la resolución "hour".
+    - continents (Index): Los continentes, en el orden de los codigos de las columnas de continente.
+    - period (str): Una resolución de `periods`.
+
+    Returns:
+    - DataFrame: Un DataFrame indexado por intervalo (en horas desde el 1970-01-01) con una columna por
+      continente con el número de vuelos.
+    """
+    codes, times = pd.factorize(time_buckets(df, period), sort=True)
+    origin = df["origin_continent"].to_numpy().astype(np.int64)
+    destination = df["destination_continent"].to_numpy().astype(np.int64)
+    weights = flight_weights(df)
+    if weights is None:
+        weights = np.ones(len(df), dtype=np.int64)
+
+    # Cada par (intervalo, continente) es una casilla; el codigo -1 (desconocido) va a la columna 0
+    n_cells = len(continents) + 1
+    size = len(times) * n_cells
+    counts = np.bincount(codes * n_cells + origin + 1, weights=weights, minlength=size)
+    counts += np.bincount(codes * n_cells + destination + 1, weights=weights * (destination != origin),
+                          minlength=size)
+
+    counts = counts.reshape(len(times), n_cells)[:, 1:].astype(np.int64)
+    return pd.DataFrame(counts, index=pd.Index(times, name="time"), columns=continents)
+
+
+def hourly_flights(df, df_continents):
+    """
+    Prepara los vuelos para las series por horas, que no pueden salir de la tabla agregada (no tiene
+    la hora): les añade los continentes sin modificar `df`, que puede ser el almacen compartido.
+
+    Parameters:
+    - df (DataFrame): Los vuelos (ya filtrados si hace falta).
+    - df_continents (DataFrame): Los aeropuertos indexados por id, sin filtrar.
+
+    Returns:
+    - DataFrame: Los vuelos con las columnas "origin_continent" y "destination_continent".
+    """
+    return add_flight_continents(df.copy(deep=False), df_continents)
+
+
+def count_flights_by_country_origin(df, df_continents):
+    """
+    Cuenta la cantidad total de vuelos por país de origen, 
+    asociando cada código ICAO con su país correspondiente.
+
+    Parameters
+    df : pandas.DataFrame
+        DataFrame que contiene datos de vuelos, con al menos una columna llamada 'origin' 
+        que representa el id del aeropuerto de origen de cada vuelo.
+    
+    df_continents : pandas.DataFrame
+        DataFrame con información sobre aeropuertos indexado por id, que incluye al menos la columna:
+        - 'country_name': nombre del país correspondiente
+
+    Returns
+        Un DataFrame con dos columnas:
+        - 'country_name': nombre del país
+        - 'num_flights': número total de vuelos originados en aeropuertos de ese país
+    """
+
+    return count_flights_by_country(df, df_continents, "origin")
+
+
+def airport_countries(df_continents):
+    """
+    Construye un array indexado por id de aeropuerto con el codigo del país de cada aeropuerto
+    (su posición en las categorias de "country_name").
+
+    Parameters:
+    - df_continents (DataFrame): Un DataFrame de aeropuertos indexado por id, puede estar filtrado.
+
+    Returns:
+    - ndarray: El array de codigos. Los aeropuertos sin país, los que no estan en `df_continents` y
+      el id -1 (ultima posicion) tienen el codigo len(categorias), que se usa como "sin país".
+    """
+    n_countries = len(df_continents["country_name"].cat.categories)
+    n_airports = int(df_continents.index.max()) + 1 if len(df_continents) else 0
+
+    codes = df_continents["country_name"].cat.codes.to_numpy().astype(np.int64)
+    countries = np.full(n_airports + 1, n_countries, dtype=np.int64)
+    countries[df_continents.index.to_numpy()] = np.where(codes >= 0, codes, n_countries)
+    return countries
+
+
+def count_flights_by_country(df, df_continents, mode="origin"):
+    """
+    Cuenta la cantidad total de vuelos por país con un único np.bincount sobre el país de cada vuelo,
+    que se obtiene indexando el array de `airport_countries` con los ids de aeropuerto.
+
+    Parameters:
+    - df (DataFrame): Un DataFrame de vuelos (o de vuelos agregados) con las columnas "origin" y "destination".
+    - df_continents (DataFrame): Un DataFrame de aeropuertos indexado por id con la columna "country_name".
+      Solo se cuentan los aeropuertos que aparecen en él.
+    - mode (str): "origin" cuenta los vuelos por país de origen, "destination" por país de destino y
+      "both" por ambos, contando una sola vez los vuelos con origen y destino en el mismo país.
+
+    Returns:
+    - DataFrame: Un DataFrame con las columnas "country_name" y "num_flights", solo con los países con algun vuelo.
+    """
+    countries = airport_countries(df_continents)
+    country_names = df_continents["country_name"].cat.categories
+    n_airports = len(countries) - 1
+    weights = flight_weights(df)
+    if weights is None:
+        weights = np.ones(len(df), dtype=np.int64)
+
+    origin = countries[np.minimum(df["origin"].to_numpy(), n_airports)]
+    destination = countries[np.minimum(df["destination"].to_numpy(), n_airports)]
+
+    # La ultima casilla es la de "sin país" y se descarta
+    size = len(country_names) + 1
+    if mode == "origin":
+        counts = np.bincount(origin, weights=weights, minlength=size)
+    elif mode == "destination":
+        counts = np.bincount(destination, weights=weights, minlength=size)
+    elif mode == "both":
+        counts = (np.bincount(origin, weights=weights, minlength=size)
+                  + np.bincount(destination, weights=weights * (destination != origin), minlength=size))
+    else:
+        raise ValueError(f"Modo desconocido: {mode}")
+
+    df_sum = pd.DataFrame({"country_name": country_names, "num_flights": counts[:-1].astype(np.int64)})
+    return df_sum[df_sum["num_flights"] > 0].reset_index(drop=True)
+
+
+# ---------------------------------------------------------------------------
+# Filtros
+
+def filter_df_continent(df_continents, col, elem):
+    """
+    Filtra un DataFrame de continentes basado en un valor específico de una columna.
+
+    Parameters:
+    - df_continents (DataFrame): Un DataFrame de pandas que contiene información sobre continentes.
+    - col (str): El nombre de la columna en la que se desea aplicar el filtro.
+    - elem (str): El valor que se utilizará para filtrar la columna especificada.
+
+    Returns:
+    - DataFrame: Un nuevo DataFrame que contiene solo las filas donde el valor de `col` es igual a `elem`.
+    """
+    df_continents_filt =  df_continents[df_continents[col]==elem]
+    return df_continents_filt
+
+
+def filter_df(df, df_continents_filt):
+    """
+    Filtra un DataFrame basado en los ids de aeropuerto de un DataFrame de continentes filtrados.
+
+    Parameters:
+    - df (DataFrame): Un DataFrame de pandas que contiene información sobre vuelos, incluyendo columnas "origin" y "destination".
+    - df_continents_filt (DataFrame): Un DataFrame de pandas indexado por el id de los aeropuertos de los continentes filtrados.
+
+    Returns:
+    - DataFrame: Un nuevo DataFrame que contiene solo las filas donde el "origin" o "destination" están entre los aeropuertos del DataFrame de continentes filtrados.
+    """
+    airport_ids = df_continents_filt.index.to_numpy()
+    df_filt = df[airport_lookup(df["origin"].to_numpy(), airport_ids) | airport_lookup(df["destination"].to_numpy(), airport_ids)]
+    return df_filt
+
+
+def do_filter(col, elem, df_filtered, df_continents_filtered):
+    """
+    Aplica un filtro a un DataFrame de continentes y luego filtra otro DataFrame basado en el resultado.
+
+    Paramters:
+    - col (str): El nombre de la columna en el DataFrame de continentes que se utilizará para aplicar el filtro.
+    - elem (str): El valor que se utilizará para filtrar la columna especificada en el DataFrame de continentes.
+    - df_filtered (DataFrame): Un DataFrame de pandas que contiene información que se filtrará en función de los continentes.
+    - df_continents_filtered (DataFrame): Un DataFrame de pandas que contiene información sobre continentes, que será filtrado.
+
+    Returns
+    - tuple: Una tupla que contiene dos elementos:
+        - DataFrame: El DataFrame filtrado basado en los continentes.
+        - DataFrame: El DataFrame de continentes filtrados después de aplicar el filtro.
+    """
+    df_continents_filtered = filter_df_continent(df_continents_filtered, col, elem)
+    df_filt = filter_df(df_filtered, df_continents_filtered)
+    return df_filt, df_continents_filtered
+
+
+def filter_day(df, type_filter, day):
+    """
+    Filtra un DataFrame basado en el valor de la columna "day" según el tipo de filtro especificado.
+    Como los vuelos estan ordenados por fecha, el resultado es un trozo contiguo que se busca con
+    `day_rows`, sin recorrer la columna.
+
+    Parameters
+    - df (DataFrame): Un DataFrame de pandas ordenado por la columna "day".
+    - type_filter (str): El tipo de filtro a aplicar. Puede ser "=", "<", o ">".
+    - day (int): El número de día (ver `date_to_day`) con el que se compara.
+
+    Returns
+    - DataFrame: Las filas que cumplen con la condición del filtro, sin copiar los datos.
+    """
+    if type_filter in day_ranges:
+        df = df.iloc[day_rows(df, *day_ranges[type_filter](day))]
+
+    return df
+
+
+def compile_filters(filtros, df_continents):
+    """
+    Convierte la lista de filtros de la barra lateral en un plan que se evalua de una sola vez.
+    Los filtros de pais y continente se resuelven antes sobre df_continents: como cada uno recorta
+    los aeropuertos que deja el anterior, aplicarlos en cadena es lo mismo que quedarse con los vuelos
+    con origen o destino en el ultimo conjunto de aeropuertos.
+
+    Parameters:
+    - filtros (list): Lista de diccionarios con las claves "columna", "comparacion" y "valor".
+    - df_continents (DataFrame): Un DataFrame de aeropuertos indexado por id.
+
+    Los filtros de día y de rango de fechas se juntan en un único rango de días (primero, último).
+
+    Returns:
+    - tuple: Un diccionario con el plan ("airports": tabla de `airport_table` o None si no hay filtros
+      de aeropuertos, "days": par (primer día, último día) o None si no hay filtros de fechas) y el
+      DataFrame de aeropuertos filtrado.
+    """
+    plan = {"airports": None, "days": None}
+    airport_filter = False
+
+    for elem in filtros:
+        if elem["columna"] == "Día" and elem["comparacion"] in day_ranges:
+            plan["days"] = intersect_days(plan["days"], day_ranges[elem["comparacion"]](elem["valor"]))
+
+        elif elem["columna"] == "Fechas" and elem["valor"] is not None:
+            plan["days"] = intersect_days(plan["days"], elem["valor"])
+
+        elif elem["columna"] in filter_columns:
+            df_continents = filter_df_continent(df_continents, filter_columns[elem["columna"]], elem["valor"])
+            airport_filter = True
+
+    if airport_filter:
+        plan["airports"] = airport_table(df_continents.index.to_numpy())
+
+    return plan, df_continents
+
+
+def intersect_days(days, new_days):
+    """
+    Junta dos rangos de días en el rango de los días que estan en los dos.
+
+    Parameters:
+    - days (tuple): Rango (primero, último) o None si todavia no hay ninguno.
+    - new_days (tuple): Rango (primero, último) a añadir.
+
+    Returns:
+    - tuple: El rango resultante (puede quedar vacio, con el primero mayor que el último).
+    """
+    if days is None:
+        return tuple(new_days)
+    return max(days[0], new_days[0]), min(days[1], new_days[1])
+
+
+def plan_rows(df, plan, index=None):
+    """
+    Busca las filas del rango de fechas de un plan de `compile_filters`.
+
+    Parameters:
+    - df (DataFrame): Un DataFrame de vuelos o de vuelos agregados, ordenado por "day".
+    - plan (dict): El plan de filtrado.
+    - index (tuple): El indice de `day_index` de `df`, opcional.
+
+    Returns:
+    - slice: Las filas del rango de fechas, o todas si no hay filtros de fechas.
+    """
+    if plan["days"] is None:
+        return slice(0, len(df))
+
+    with stage(f"rango de fechas {plan['days'][0]}-{plan['days'][1]}"):
+        return day_rows(df, *plan["days"], index=index)
+
+
+def airport_mask(df, plan):
+    """
+    Evalua el filtro de aeropuertos de un plan de `compile_filters`.
+
+    Parameters:
+    - df (DataFrame): Un DataFrame de vuelos o de vuelos agregados.
+    - plan (dict): El plan de filtrado, con "airports" distinto de None.
+
+    Returns:
+    - ndarray: Un array de booleanos con las filas con origen o destino en los aeropuertos elegidos.
+    """
+    with stage("filtro de aeropuertos"):
+        table = plan["airports"]
+        return in_airport_table(df["origin"].to_numpy(), table) | in_airport_table(df["destination"].to_numpy(), table)
+
+
+def plan_mask(df, plan, index=None):
+    """
+    Evalua un plan de `compile_filters` sobre un DataFrame de vuelos, sin crear DataFrames intermedios.
+    El filtro de aeropuertos solo se evalua en las filas del rango de fechas.
+
+    Parameters:
+    - df (DataFrame): Un DataFrame de vuelos o de vuelos agregados, ordenado por "day".
+    - plan (dict): El plan de filtrado.
+    - index (tuple): El indice de `day_index` de `df`, opcional.
+
+    Returns:
+    - ndarray: Un array de booleanos con las filas que cumplen todos los filtros.
+    """
+    rows = plan_rows(df, plan, index)
+    mask = np.zeros(len(df), dtype=bool)
+
+    if plan["airports"] is None:
+        mask[rows] = True
+    else:
+        mask[rows] = airport_mask(df.iloc[rows], plan)
+
+    return mask
+
+
+def apply_filters(df, df_continents, filtros, index=None):
+    """
+    Aplica todos los filtros elegidos en la barra lateral. Las fechas se resuelven con una busqueda
+    binaria (un trozo de filas, sin copia) y los aeropuertos con una sola mascara sobre ese trozo.
+
+    Parameters:
+    - df (DataFrame): Un DataFrame de vuelos o de vuelos agregados, ordenado por "day".
+    - df_continents (DataFrame): Un DataFrame de aeropuertos indexado por id.
+    - filtros (list): Lista de diccionarios con las claves "columna", "comparacion" y "valor".
+    - index (tuple): El indice de `day_index` de `df`, opcional.
+
+    Returns:
+    - tuple: El DataFrame de vuelos y el de aeropuertos después de aplicar los filtros.
+    """
+    plan, df_continents = compile_filters(filtros, df_continents)
+
+    if plan["airports"] is None and plan["days"] is None:
+        return df, df_continents
+
+    df = df.iloc[plan_rows(df, plan, index)]
+    if plan["airports"] is None:
+        return df, df_continents
+
+    mask = airport_mask(df, plan)
+    with stage("recorte de filas"):
+        return df[mask], df_continents
+
+
+def filters_key(filtros):
+    """
+    Normaliza la lista de filtros para usarla como clave de cache. Se quitan los filtros incompletos
+    y se ordenan, porque el resultado no depende del orden en el que se aplican.
+
+    Parameters:
+    - filtros (list): Lista de diccionarios con las claves "columna", "comparacion" y "valor".
+
+    Returns:
+    - tuple: Una tupla de tuplas (columna, comparación, valor).
+    """
+    key = list()
+    for elem in filtros:
+        if elem["columna"] == "Día" and elem["comparacion"] in day_ranges and elem["valor"] is not None:
+            key.append(("Día", elem["comparacion"], int(elem["valor"])))
+
+        elif elem["columna"] == "Fechas" and elem["valor"] is not None:
+            key.append(("Fechas", "entre", tuple(int(day) for day in elem["valor"])))
+
+        elif elem["columna"] in filter_columns:
+            key.append((elem["columna"], "=", str(elem["valor"])))
+
+    return tuple(sorted(key))
+
+
+# ---------------------------------------------------------------------------
+# Tablas por páginas
+
+def sort_key(values):
+    """
+    Convierte una columna en un array de numeros que se ordena igual que sus valores, para poder
+    ordenar las filas con np.argsort. Los valores vacios pasan a NaN, asi quedan al final en los dos sentidos.
+
+    Parameters:
+    - values (Series): La columna por la que se ordena.
+
+    Returns:
+    - ndarray: Un array de floats con un número por fila.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # Las categorias de astype("category") ya vienen ordenadas
+        codes = values.cat.codes.to_numpy()
+    elif pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(dtype=np.float64, na_value=np.nan)
+    else:
+        codes, _ = pd.factorize(values, sort=True)
+
+    return np.where(codes >= 0, codes, np.nan)
+
+
+def airport_sort_keys(df_continents):
+    """
+    Construye un array indexado por id de aeropuerto con la posición de su codigo ICAO en orden
+    alfabetico, para ordenar los vuelos por aeropuerto sin decodificar toda la tabla.
+
+    Parameters:
+    - df_continents (DataFrame): Un DataFrame con la columna "icao_code" e indexado por id (sin filtrar).
+
+    Returns:
+    - ndarray: El array de posiciones. El id -1 (ultima posición) es NaN.
+    """
+    return np.append(sort_key(df_continents["icao_code"]), np.nan)
+
+
+def table_rows(mask, keys=None, ascending=True):
+    """
+    Calcula qué filas de una tabla se muestran y en qué orden, sin copiar la tabla.
+
+    Parameters:
+    - mask (ndarray): Un array de booleanos con las filas que cumplen los filtros.
+    - keys (ndarray): El array de `sort_key` de la columna por la que se ordena, o None para no ordenar.
+    - ascending (bool): Si se ordena de menor a mayor.
+
+    Returns:
+    - ndarray: Las posiciones de las filas a mostrar, en orden.
+    """
+    rows = np.flatnonzero(mask)
+
+    if keys is not None:
+        keys = keys[rows]
+        # Cambiando el signo se ordena de mayor a menor sin perder el orden original de los empates
+        rows = rows[np.argsort(keys if ascending else -keys, kind="stable")]
+
+    return rows
+
+
+def flight_table_rows(df, df_airports, filtros, sort_column, ascending, index=None):
+    """
+    Calcula las filas de la tabla de vuelos que se muestran, aplicando los filtros y el orden elegido.
+    Los aeropuertos se ordenan por su codigo ICAO, que es lo que se ve en la tabla.
+
+    Parameters:
+    - df (DataFrame): El DataFrame de vuelos completo.
+    - df_airports (DataFrame): El DataFrame de aeropuertos indexado por id (sin filtrar).
+    - filtros (list): Los filtros aplicados.
+    - sort_column (str): La columna por la que se ordena, o None.
+    - ascending (bool): Si se ordena de menor a mayor.
+    - index (tuple): El indice de `day_index` de `df`, opcional.
+
+    Returns:
+    - ndarray: Las posiciones de las filas a mostrar, en orden.
+    """
+    plan, _ = compile_filters(filtros, df_airports)
+
+    keys = None
+    if sort_column in ("origin", "destination"):
+        keys = airport_sort_keys(df_airports)[df[sort_column].to_numpy()]
+    elif sort_column is not None:
+        keys = sort_key(df[sort_column])
+
+    return table_rows(plan_mask(df, plan, index), keys, ascending)
+
+
+# ---------------------------------------------------------------------------
+# Rutas de OpenFlights (app.py)
+
+# Ficheros de OpenFlights y sus columnas (documentadas en OpenFlights)
+url_airports = "https://raw.githubusercontent.com/jpatokal/openflights/master/data/airports.dat"
+url_airlines = "https://raw.githubusercontent.com/jpatokal/openflights/master/data/airlines.dat"
+url_routes = "https://raw.githubusercontent.com/jpatokal/openflights/master/data/routes.dat"
+
+columns_airports = [
+    "Airport ID", "Name", "City", "Country", "IATA", "ICAO",
+    "Latitude", "Longitude", "Altitude", "Timezone", "DST",
+    "Tz database time zone", "Type", "Source"
+]
+
+columns_airlines = [
+    "Airline ID", "Name", "Alias", "IATA", "ICAO", "Callsign",
+    "Country", "Active"
+]
+
+columns_routes = [
+    "Airline", "Airline ID", "Source airport", "Source airport ID",
+    "Destination airport", "Destination airport ID",
+    "Codeshare", "Stops", "Equipment"
+]
+
+# Nombre del fichero donde el CLI guarda los trayectos de ida y vuelta ya calculados, seguido de la version
+# de los datos de OpenFlights con los que se calcularon (ver `journeys_path`)
+journeys_file = "df_ida_vuelta"
+
+
+def read_openflights():
+    """
+    Carga los datos públicos de la base de datos OpenFlights directamente desde GitHub
+
+    Returns:
+    -------
+    - Tres objetos de tipo pandas.Dataframe:
+        df_airports, df_airlines, df_routes
+    """
+    df_airports = pd.read_csv(url_airports, header=None, names=columns_airports)
+    df_airlines = pd.read_csv(url_airlines, header=None, names=columns_airlines)
+    df_routes = pd.read_csv(url_routes, header=None, names=columns_routes)
+
+    return df_airports, df_airlines, df_routes
+
+
+def airport_index(df_airports, column="IATA"):
+    """
+    Construye el indice de los aeropuertos de OpenFlights: la posición de la fila de cada codigo en
+    `df_airports`. Se construye una vez con los datos y con `airport_rows` sirve para sacar cualquier
+    columna de los aeropuertos sin hacer merges.
+
+    Parameters:
+    - df_airports (DataFrame): Los aeropuertos de OpenFlights.
+    - column (str): La columna con los codigos.
+
+    Returns:
+    - Series: La posición de la fila de cada codigo, indexada por codigo. Si un codigo se repite se
+      queda la primera fila.
+    """
+    codes = df_airports[column]
+    first = ~codes.duplicated().to_numpy()
+    return pd.Series(np.flatnonzero(first), index=pd.Index(codes.to_numpy()[first], name=column))
+
+
+def airport_rows(index, codes):
+    """
+    Busca la fila de cada aeropuerto en el indice de `airport_index`, todos a la vez.
+
+    Parameters:
+    - index (Series): El indice de `airport_index`.
+    - codes (Series o ndarray): Los codigos a buscar.
+
+    Returns:
+    - ndarray: La posición de la fila de cada codigo, o -1 si el codigo no está.
+    """
+    # get_indexer devuelve -1 para los codigos que no estan, que caen en la ultima casilla
+    return np.append(index.to_numpy(), -1)[index.index.get_indexer(codes)]
+
+
+def unir_pos_geografica(df, df_airports, columns=["Source airport", "Destination airport"], index=None):
+    """
+    Añade la latitud y la longitud de los aeropuertos de las columnas indicadas.
+
+    Parameters:
+    - df (DataFrame): Un DataFrame con codigos IATA de aeropuertos.
+    - df_airports (DataFrame): Los aeropuertos de OpenFlights, con las columnas "IATA", "Latitude" y "Longitude".
+    - columns (list): Columnas de `df` con los codigos IATA.
+    - index (Series): El indice de `airport_index` de `df_airports`. Si no se da se construye aqui.
+
+    Returns:
+    - DataFrame: `df` con las columnas "<Source/Destination> Latitude" y "<Source/Destination> Longitude"
+      (NaN si el aeropuerto no está en `df_airports`).
+    """
+    if index is None:
+        index = airport_index(df_airports)
+
+    rows = {posicion: airport_rows(index, df[posicion]) for posicion in columns}
+
+    nuevas = dict()
+    for eje, posicion in itertools.product(["Latitude", "Longitude"], columns):
+        # La ultima casilla es NaN, para los aeropuertos que no estan
+        values = np.append(df_airports[eje].to_numpy(dtype=np.float64), np.nan)
+        nuevas[f"{posicion.split()[0]} {eje}"] = values[rows[posicion]]
+    return df.assign(**nuevas)
+
+
+def openflights_version(df_airports, df_routes):
+    """
+    Calcula una version de los datos de OpenFlights a partir del contenido de las columnas que usan
+    los trayectos, igual que `data_version` con los vuelos.
+
+    Parameters:
+    - df_airports (DataFrame): Los aeropuertos de OpenFlights.
+    - df_routes (DataFrame): Las rutas de OpenFlights.
+
+    Returns:
+    - str: Un hash que cambia cuando cambian las rutas o la posición de algun aeropuerto.
+    """
+    sha = hashlib.sha256()
+    for df, columns in [(df_airports, ["IATA", "Latitude", "Longitude"]),
+                        (df_routes, ["Source airport", "Destination airport"])]:
+        sha.update(pd.util.hash_pandas_object(df[columns], index=False).to_numpy().tobytes())
+    return sha.hexdigest()
+
+
+def journeys_path(version, aggregates_dir=aggregates_dir):
+    """
+    Construye la ruta de los trayectos precalculados con una version de OpenFlights.
+
+    Parameters:
+    - version (str): La version de `openflights_version`.
+    - aggregates_dir (str): La carpeta de los agregados.
+
+    Returns:
+    - str: La ruta del fichero parquet.
+    """
+    return os.path.join(aggregates_dir, f"{journeys_file}-{version}.parquet")
+
+
+def save_journeys(df_ida_vuelta, version, aggregates_dir=aggregates_dir):
+    """
+    Guarda los trayectos precalculados y borra los de versiones anteriores de OpenFlights.
+
+    Parameters:
+    - df_ida_vuelta (DataFrame): Los trayectos de `build_journeys`.
+    - version (str): La version de `openflights_version`.
+    - aggregates_dir (str): La carpeta de los agregados.
+
+    Returns:
+    - str: La ruta del fichero guardado.
+    """
+    path = journeys_path(version, aggregates_dir)
+    os.makedirs(aggregates_dir, exist_ok=True)
+    with atomic_write(path) as tmp:
+        df_ida_vuelta.to_parquet(tmp, index=False)
+
+    for old in os.listdir(aggregates_dir):
+        if old.startswith(f"{journeys_file}-") and old.endswith(".parquet") and old != os.path.basename(path):
+            os.remove(os.path.join(aggregates_dir, old))
+    return path
+
+
+def num_vuelos_ida_vuelta(df):
+    """
+    Cuenta cuántos trayectos hay entre cada par de aeropuertos, juntando la ida y la vuelta.
+
+    Cada par se identifica por los codigos de sus dos aeropuertos ordenados (el menor primero), asi que
+    A-B y B-A caen en el mismo par y se cuentan con un solo np.bincount, sin construir ni partir strings.
+    Cada par se queda con la fila del primer trayecto en el que aparece (su nombre y sus aeropuertos).
+
+    Parameters:
+    - df (DataFrame): Los trayectos, con las columnas "Journeys" ("ORIGEN-DESTINO"), "Source airport"
+      y "Destination airport".
+
+    Returns:
+    - DataFrame: Un DataFrame con las columnas "Journeys", "Num vuelos", "Source airport" y "Destination airport",
+      en el orden en el que aparece cada par en `df`.
+    """
+    n_trips = len(df)
+    airports = np.concatenate([df["Source airport"].to_numpy(dtype=object),
+                               df["Destination airport"].to_numpy(dtype=object)])
+    codes, uniques = pd.factorize(airports, use_na_sentinel=False)
+    source, destination = codes[:n_trips].astype(np.int64), codes[n_trips:].astype(np.int64)
+
+    # El par (menor, mayor) como un único entero, y el número de cada par por orden de aparición
+    pairs = np.minimum(source, destination) * len(uniques) + np.maximum(source, destination)
+    pair_codes, _ = pd.factorize(pairs)
+    _, first = np.unique(pair_codes, return_index=True)
+
+    df_result = df[["Journeys", "Source airport", "Destination airport"]].iloc[first].reset_index(drop=True)
+    df_result.insert(1, "Num vuelos", np.bincount(pair_codes, minlength=len(first)).astype(np.int64))
+    return df_result
+
+
+def build_trips(df_routes):
+    """
+    Agrupa las rutas de OpenFlights por aeropuerto de origen y de destino.
+
+    Parameters:
+    - df_routes (DataFrame): Las rutas de OpenFlights.
+
+    Returns:
+    - DataFrame: Un trayecto por fila, con el número de rutas en "vuelos" y el nombre en "Journeys".
+    """
+    df_trips = df_routes.groupby(["Source airport", "Destination airport"]).size().reset_index(name="vuelos")
+    df_trips["Journeys"] = df_trips["Source airport"] + "-" + df_trips["Destination airport"]
+    return df_trips
+
+
+def build_journeys(df_airports, df_routes, index=None):
+    """
+    Calcula los trayectos de ida y vuelta que dibuja `app.py`, con la posición de sus aeropuertos.
+
+    Parameters:
+    - df_airports (DataFrame): Los aeropuertos de OpenFlights.
+    - df_routes (DataFrame): Las rutas de OpenFlights.
+    - index (Series): El indice de `airport_index` de `df_airports`, opcional.
+
+    Returns:
+    - DataFrame: El resultado de `num_vuelos_ida_vuelta` con las posiciones de `unir_pos_geografica`.
+    """
+    df_ida_vuelta = num_vuelos_ida_vuelta(build_trips(df_routes))
+    return unir_pos_geografica(df_ida_vuelta, df_airports, index=index)
+
+
+# ---------------------------------------------------------------------------
+# Precalculo en lote
+
+def unfiltered_aggregates(df, df_cube, df_continents):
+    """
+    Calcula los agregados que usan las gráficas cuando no hay filtros.
+
+    Parameters:
+    - df (DataFrame): Los vuelos, para las series por horas.
+    - df_cube (DataFrame): La tabla agregada de vuelos, con las columnas de continente.
+    - df_continents (DataFrame): Los aeropuertos indexados por id.
+
+    Returns:
+    - dict: Los agregados, con su nombre como clave: "flights_per_<resolución>" y
+      "flights_per_<resolución>_by_continent" para cada resolución de `periods`, y
+      "flights_by_country_<modo>" para cada modo de `country_modes`.
+    """
+    aggregates = dict()
+    continents = df_continents["continent"].cat.categories
+    for period in periods:
+        # La tabla agregada es más pequeña, pero no tiene la hora
+        source = hourly_flights(df, df_continents) if period == "hour" else df_cube
+        aggregates[f"flights_per_{period}"] = count_flights_per_period(source, period)
+        aggregates[f"flights_per_{period}_by_continent"] = count_flights_per_period_by_continent(
+            source, continents, period)
+    for mode in country_modes:
+        aggregates[f"flights_by_country_{mode}"] = count_flights_by_country(df_cube, df_continents, mode)
+    return aggregates
+
+
+def save_aggregates(aggregates, path):
+    """
+    Guarda cada agregado como un parquet dentro de la carpeta `path`, con `atomic_write`.
+
+    Parameters:
+    - aggregates (dict): Los agregados de `unfiltered_aggregates`.
+    - path (str): Carpeta de destino.
+    """
+    with atomic_write(path, directory=True) as tmp:
+        for name, frame in aggregates.items():
+            frame.to_parquet(os.path.join(tmp, f"{name}.parquet"))
+
+
+def load_aggregates(version, aggregates_dir=aggregates_dir):
+    """
+    Lee los agregados precalculados por el CLI para una version de los datos.
+
+    Parameters:
+    - version (str): La version de los datos, de `data_version`.
+    - aggregates_dir (str): Carpeta de los agregados.
+
+    Returns:
+    - dict o None: Los agregados, con su nombre como clave, o None si no se han precalculado para esta version.
+    """
+    path = os.path.join(aggregates_dir, version)
+    if not os.path.isdir(path):
+        return None
+
+    return {file[:-len(".parquet")]: pd.read_parquet(os.path.join(path, file))
+            for file in sorted(os.listdir(path)) if file.endswith(".parquet")}
+
+
+# ---------------------------------------------------------------------------
+# Datos nuevos
+
+def merge_aggregates(aggregates, delta):
+    """
+    Suma a los agregados de `unfiltered_aggregates` los de un lote de vuelos nuevos. El coste depende
+    del tamaño de los agregados (intervalos de tiempo y paises), no del número de vuelos.
+
+    Parameters:
+    - aggregates (dict): Los agregados actuales.
+    - delta (dict): Los agregados del lote, con los mismos nombres.
+
+    Returns:
+    - dict: Los agregados nuevos. `aggregates` no se modifica.
+    """
+    merged = dict()
+    for name, frame in aggregates.items():
+        if name.startswith("flights_by_country_"):
+            counts = pd.concat([frame, delta[name]]).groupby("country_name", sort=True)["num_flights"].sum()
+            merged[name] = counts.reset_index()
+
+        elif name.endswith("_by_continent"):
+            merged[name] = frame.add(delta[name], fill_value=0).astype(np.int64)
+
+        else:
+            counts = frame["num_flights"].add(delta[name]["num_flights"], fill_value=0).astype(np.int64)
+            merged[name] = pd.DataFrame({"num_flights": counts, "time": counts.index}, index=counts.index)
+
+    return merged
+
+
+def read_batch(path, n_airports):
+    """
+    Lee un fichero de vuelos nuevos y lo ordena por fecha, como el almacen.
+
+    Parameters:
+    - path (str): Ruta del fichero, con las columnas de `flight_dtypes`.
+    - n_airports (int): Número de aeropuertos de df_continents, para comprobar los ids.
+
+    Returns:
+    - DataFrame: Los vuelos del fichero.
+    """
+    batch = read_table(path, flight_dtypes).astype(flight_dtypes)
+    for column in ["origin", "destination"]:
+        ids = batch[column].to_numpy()
+        if len(ids) and (ids.min() < -1 or ids.max() >= n_airports):
+            raise ValueError(f"{path}: la columna {column} tiene ids de aeropuerto que no estan en df_continents")
+
+    return batch.sort_values("day", kind="stable", ignore_index=True)
+
+
+def filter_pieces(pieces, df_continents, filtros):
+    """
+    Aplica los filtros a cada trozo de una tabla (la cargada y los lotes nuevos) y junta los resultados.
+
+    Parameters:
+    - pieces (tuple): Pares (DataFrame ordenado por "day", indice de `day_index` o None).
+    - df_continents (DataFrame): Un DataFrame de aeropuertos indexado por id, sin filtrar.
+    - filtros (list): Lista de diccionarios con las claves "columna", "comparacion" y "valor".
+
+    Returns:
+    - DataFrame: Las filas de todos los trozos que cumplen los filtros. Con un solo trozo no se copia nada.
+    """
+    frames = [apply_filters(frame, df_continents, filtros, index)[0] for frame, index in pieces]
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames, ignore_index=True)
+
+
+class LiveFlights:
+    """
+    Los vuelos cargados más los lotes que van llegando a `incoming_dir`. Cada lote se añade como un trozo
+    aparte (sin copiar los datos cargados) y sus agregados se suman a los agregados sin filtros, asi que
+    añadir un lote cuesta lo que el lote y no lo que todo el dataset.
+
+    El estado es un diccionario que no se modifica: cada lote crea uno nuevo, y quien lo haya leido antes
+    sigue viendo el anterior sin mezclar los dos.
+    """
+
+    def __init__(self, df, df_cube, df_continents, version, indexes=(None, None), aggregates=None,
+                 incoming_dir=incoming_dir):
+        self.df_continents = df_continents
+        self.incoming_dir = incoming_dir
+        self.base_version = version
+        self.lock = threading.Lock()
+        self.seen = set()
+        self.batches = 0
+
+        if aggregates is None:
+            aggregates = unfiltered_aggregates(df, df_cube, df_continents)
+
+        self.state = {"version": version,
+                      "flights": ((df, indexes[0]),),
+                      "cubes": ((df_cube, indexes[1]),),
+                      "aggregates": aggregates,
+                      "days": np.unique(df_cube["day"].to_numpy()) if indexes[1] is None else indexes[1][0],
+                      "appended": 0,
+                      "errors": dict()}
+
+    def append(self, batch):
+        """
+        Añade un lote de vuelos nuevos.
+
+        Parameters:
+        - batch (DataFrame): Los vuelos, con las columnas de `flight_dtypes` y ordenados por "day".
+
+        Returns:
+        - dict: El estado nuevo.
+        """
+        with stage("lote nuevo"):
+            batch_cube = add_flight_continents(build_flight_cube(batch), self.df_continents)
+            delta = unfiltered_aggregates(batch, batch_cube, self.df_continents)
+
+        with self.lock:
+            state = self.state
+            self.batches += 1
+            self.state = {**state,
+                          "version": f"{self.base_version}+{self.batches}",
+                          "flights": state["flights"] + ((batch, None),),
+                          "cubes": state["cubes"] + ((batch_cube, None),),
+                          "aggregates": merge_aggregates(state["aggregates"], delta),
+                          "days": np.union1d(state["days"], batch_cube["day"].to_numpy()),
+                          "appended": state["appended"] + len(batch)}
+            return self.state
+
+    def refresh(self):
+        """
+        Añade los ficheros de `incoming_dir` que no se habian leido todavia, todos juntos como un lote.
+        Los ficheros que no se pueden leer se apuntan en "errors" y no se vuelven a intentar.
+
+        Returns:
+        - dict: El estado actual, con las claves "version" (la de los datos más el número de lotes),
+          "flights" y "cubes" (los trozos para `filter_pieces`), "aggregates" (los agregados sin filtros),
+          "days" (las fechas con vuelos), "appended" (vuelos añadidos) y "errors".
+        """
+        if not os.path.isdir(self.incoming_dir):
+            return self.state
+
+        with self.lock:
+            files = sorted(file for file in os.listdir(self.incoming_dir)
+                           if file.endswith(batch_extensions) and file not in self.seen)
+            self.seen.update(files)
+
+        batches, errors = list(), dict()
+        for file in files:
+            try:
+                batches.append(read_batch(os.path.join(self.incoming_dir, file), len(self.df_continents)))
+            except (OSError, ValueError, KeyError) as error:
+                errors[file] = str(error)
+
+        if errors:
+            with self.lock:
+                self.state = {**self.state, "errors": {**self.state["errors"], **errors}}
+        if batches:
+            batch = pd.concat(batches, ignore_index=True).sort_values("day", kind="stable", ignore_index=True)
+            return self.append(batch)
+        return self.state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precalcula en lote el almacen de vuelos y los agregados "
+                                                 "que cargan las aplicaciones")
+    parser.add_argument("--aggregates-dir", default=aggregates_dir, help="Carpeta donde se guardan los agregados")
+    parser.add_argument("--routes", action="store_true",
+                        help=f"Tambien descarga OpenFlights y guarda los trayectos de app.py en "
+                             f"{journeys_file}-<version>.parquet")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    version = data_version()
+    df_continents = read_continents()
+    frames = load_column_store(build_store(df_continents, version))
+    print(f"Almacen de columnas en {os.path.join(store_dir, version)} ({time.perf_counter() - start:.2f} s)")
+
+    save_aggregates(unfiltered_aggregates(frames["df"], frames["df_cube"], df_continents),
+                    os.path.join(args.aggregates_dir, version))
+    # Las versiones anteriores ya no se van a usar
+    remove_old_versions(args.aggregates_dir, version)
+    print(f"Agregados en {os.path.join(args.aggregates_dir, version)} ({time.perf_counter() - start:.2f} s)")
+
+    if args.routes:
+        df_airports, _, df_routes = read_openflights()
+        df_ida_vuelta = build_journeys(df_airports, df_routes)
+        path = save_journeys(df_ida_vuelta, openflights_version(df_airports, df_routes), args.aggregates_dir)
+        print(f"{len(df_ida_vuelta)} trayectos en {path} ({time.perf_counter() - start:.2f} s)")